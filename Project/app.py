@@ -1,8 +1,10 @@
+import json
 import os
-import cv2
-import numpy as np
-from flask import Flask, render_template, request, redirect, url_for, send_from_directory
-from ultralytics import YOLO
+import threading
+from flask import Flask, render_template, request, redirect, url_for, send_from_directory, jsonify, Response
+from werkzeug.utils import secure_filename
+from jobs import JobManager
+from result_store import ResultStore
 
 app = Flask(__name__)
 
@@ -10,131 +12,73 @@ app = Flask(__name__)
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 app.config['UPLOAD_FOLDER'] = os.path.join(BASE_DIR, 'uploads')
 app.config['STATIC_FOLDER'] = os.path.join(BASE_DIR, 'static')
+# Number of frames passed to YOLO per inference call
+app.config['YOLO_BATCH_SIZE'] = int(os.environ.get('YOLO_BATCH_SIZE', 8))
+# Frames buffered between the decoder / detector / encoder threads
+app.config['DECODE_QUEUE_SIZE'] = int(os.environ.get('DECODE_QUEUE_SIZE', 32))
+app.config['ENCODE_QUEUE_SIZE'] = int(os.environ.get('ENCODE_QUEUE_SIZE', 32))
+# Skip YOLO on frames without motion; with tracking, also relabel all tracks every N-th frame (0 = never)
+app.config['MOTION_GATING'] = os.environ.get('MOTION_GATING', '1') == '1'
+app.config['DETECT_EVERY'] = int(os.environ.get('DETECT_EVERY', 0))
+# Default inference mode ('full' frame or 'roi' crops), overridable per request
+app.config['INFERENCE_MODE'] = os.environ.get('INFERENCE_MODE', 'full')
+app.config['ROI_PADDING'] = int(os.environ.get('ROI_PADDING', 32))
+# Track moving objects across frames and only re-detect new / stale tracks
+app.config['TRACKING'] = os.environ.get('TRACKING', '0') == '1'
+app.config['RELABEL_EVERY'] = int(os.environ.get('RELABEL_EVERY', 30))
+# Analyse frames scaled down to this longer side, draw on the full frame (0 = off)
+app.config['ANALYSIS_MAX_SIDE'] = int(os.environ.get('ANALYSIS_MAX_SIDE', 0))
+# Videos processed in parallel by the background worker pool
+app.config['MAX_CONCURRENT_JOBS'] = int(os.environ.get('MAX_CONCURRENT_JOBS', 2))
+# Split each video into this many segments processed in parallel (1 = off)
+app.config['SEGMENTS'] = int(os.environ.get('SEGMENTS', 1))
+# Annotated frames buffered per job for live viewers; older frames are dropped
+app.config['STREAM_BUFFER_FRAMES'] = int(os.environ.get('STREAM_BUFFER_FRAMES', 16))
+# Seconds the status of a finished job stays available (0 = for good)
+app.config['JOB_TTL'] = int(os.environ.get('JOB_TTL', 3600))
+# Processed videos are stored by content hash; oldest are evicted past this size
+app.config['RESULTS_FOLDER'] = os.path.join(app.config['STATIC_FOLDER'], 'results')
+app.config['RESULTS_MAX_BYTES'] = int(os.environ.get('RESULTS_MAX_BYTES', 2 * 1024 ** 3))
+# Write per-frame stage timings of every job to traces/<job>.<json|csv> ('' = off)
+app.config['TRACE_FOLDER'] = os.path.join(BASE_DIR, 'traces')
+app.config['TRACE_FORMAT'] = os.environ.get('TRACE_FORMAT', '')
 
 # Ensure directories exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['STATIC_FOLDER'], exist_ok=True)
-
-# Load YOLO model
-model = YOLO('yolov8n.pt')
-
-def process_video(input_path, output_path):
-    cap = cv2.VideoCapture(input_path)
-    if not cap.isOpened():
-        print("Error opening video stream or file")
-        return
-
-    # Video properties
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    fps = int(cap.get(cv2.CAP_PROP_FPS))
-    
-    # Output writer
-    # Try 'avc1' for better browser compatibility, fallback to 'mp4v'
-    fourcc = cv2.VideoWriter_fourcc(*'avc1')
-    out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
-    if not out.isOpened():
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
-
-    # Background Subtractor
-    backSub = cv2.createBackgroundSubtractorMOG2(history=500, varThreshold=50, detectShadows=True)
-
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
-
-        # 1. Background Subtraction
-        fgMask = backSub.apply(frame)
-        
-        # Cleanup mask (remove noise/shadows)
-        _, fgMask = cv2.threshold(fgMask, 250, 255, cv2.THRESH_BINARY)
-        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
-        fgMask = cv2.morphologyEx(fgMask, cv2.MORPH_OPEN, kernel)
-        fgMask = cv2.dilate(fgMask, kernel, iterations=2)
-
-        # 2. Find Contours (Moving Objects)
-        contours, _ = cv2.findContours(fgMask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-        # 3. YOLO Detection
-        results = model(frame, verbose=False)
-        yolo_boxes = []
-        for r in results:
-            boxes = r.boxes
-            for box in boxes:
-                x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                conf = float(box.conf[0].cpu().numpy())
-                cls = int(box.cls[0].cpu().numpy())
-                name = model.names[cls]
-                yolo_boxes.append({
-                    'bbox': (x1, y1, x2, y2),
-                    'conf': conf,
-                    'name': name
-                })
-
-        # 4. Match Motion to YOLO
-        for cnt in contours:
-            area = cv2.contourArea(cnt)
-            if area < 500: # Filter small movements
-                continue
-
-            x, y, w, h = cv2.boundingRect(cnt)
-            mx1, my1, mx2, my2 = x, y, x+w, y+h
-            
-            # Find best matching YOLO box
-            best_match = None
-            max_iou = 0.0
-
-            for yb in yolo_boxes:
-                yx1, yy1, yx2, yy2 = yb['bbox']
-                
-                # Calculate Intersection
-                ix1 = max(mx1, yx1)
-                iy1 = max(my1, yy1)
-                ix2 = min(mx2, yx2)
-                iy2 = min(my2, yy2)
-                
-                iw = max(0, ix2 - ix1)
-                ih = max(0, iy2 - iy1)
-                intersection = iw * ih
-                
-                # Calculate Union
-                motion_area = w * h
-                yolo_area = (yx2 - yx1) * (yy2 - yy1)
-                union = motion_area + yolo_area - intersection
-                
-                if union > 0:
-                    iou = intersection / union
-                    if iou > 0.1: 
-                        if iou > max_iou:
-                            max_iou = iou
-                            best_match = yb
-
-            # Draw
-            color = (255, 255, 255) # White
-            cv2.rectangle(frame, (x, y), (x+w, y+h), color, 2)
-            
-            label = ""
-            if best_match:
-                label = f"{best_match['name']} ({best_match['conf']:.2f})"
-            else:
-                label = "Unknown"
-
-            cv2.putText(frame, label, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
-
-        out.write(frame)
-
-    cap.release()
-    out.release()
-    cv2.destroyAllWindows()
-    
-    return {
-        'width': width,
-        'height': height,
-        'fps': fps,
-        'total_frames': int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) if cap.get(cv2.CAP_PROP_FRAME_COUNT) > 0 else 0
-    }
+if app.config['TRACE_FORMAT']:
+    os.makedirs(app.config['TRACE_FOLDER'], exist_ok=True)
+
+# Background video processing
+jobs = JobManager(max_workers=app.config['MAX_CONCURRENT_JOBS'],
+                  stream_buffer=app.config['STREAM_BUFFER_FRAMES'],
+                  job_ttl=app.config['JOB_TTL'])
+results = ResultStore(app.config['RESULTS_FOLDER'], max_bytes=app.config['RESULTS_MAX_BYTES'])
+
+# Result key -> job ID of the job currently producing it
+in_flight = {}
+in_flight_lock = threading.RLock()
+
+def _finish_job(key, stats, input_path):
+    # The upload is only needed while its job runs
+    try:
+        os.remove(input_path)
+    except OSError:
+        pass
+    try:
+        if stats is None:
+            # Drop the partial video of a failed job
+            try:
+                os.remove(results.video_path(key))
+            except OSError:
+                pass
+        else:
+            results.put(key, stats)
+    finally:
+        # Only once the result is stored, so an identical upload in between
+        # finds either the running job or the result, never neither
+        with in_flight_lock:
+            in_flight.pop(key, None)
 
 @app.route('/')
 def index():
@@ -150,20 +94,136 @@ def process():
         return redirect(url_for('index'))
 
     if file:
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
+        job_id = jobs.new_id()
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{job_id}_{secure_filename(file.filename)}")
         file.save(filepath)
         
-        output_filename = 'output.mp4'
-        output_path = os.path.join(app.config['STATIC_FOLDER'], output_filename)
-        
-        # Process
-        stats = process_video(filepath, output_path)
+        inference_mode = request.form.get('inference_mode', app.config['INFERENCE_MODE'])
+        if inference_mode not in ('full', 'roi'):
+            inference_mode = 'full'
+
+        # Parameters that change the output video / stats
+        params = dict(motion_gating=app.config['MOTION_GATING'],
+                      detect_every=app.config['DETECT_EVERY'],
+                      inference_mode=inference_mode,
+                      roi_padding=app.config['ROI_PADDING'],
+                      track=app.config['TRACKING'],
+                      relabel_every=app.config['RELABEL_EVERY'],
+                      segments=app.config['SEGMENTS'],
+                      max_side=app.config['ANALYSIS_MAX_SIDE'])
+        # Throughput tuning only: same output with any values
+        options = dict(params,
+                       batch_size=app.config['YOLO_BATCH_SIZE'],
+                       decode_queue_size=app.config['DECODE_QUEUE_SIZE'],
+                       encode_queue_size=app.config['ENCODE_QUEUE_SIZE'])
+
+        # Same video with the same parameters: reuse the stored result
+        key = ResultStore.key_for(filepath, params)
+        stats = results.get(key)
+        if stats is not None:
+            os.remove(filepath)
+            return jsonify({
+                'status': 'done',
+                'cached': True,
+                'result_key': key,
+                'stats': stats,
+                'result_url': url_for('stored_result', key=key)
+            })
+
+        with in_flight_lock:
+            running_id = in_flight.get(key)
+            if running_id is None:
+                # Queue for background processing and answer straight away
+                in_flight[key] = job_id
+                trace_path = None
+                if app.config['TRACE_FORMAT'] in ('json', 'csv'):
+                    trace_path = os.path.join(app.config['TRACE_FOLDER'], f"{job_id}.{app.config['TRACE_FORMAT']}")
+                jobs.submit(filepath, results.video_path(key), job_id=job_id,
+                            on_complete=lambda stats: _finish_job(key, stats, filepath),
+                            trace_path=trace_path, **options)
+        if running_id is not None:
+            # Already being processed for an earlier upload
+            os.remove(filepath)
+            job_id = running_id
         
-        return render_template('result.html', video_file=output_filename, stats=stats)
+        return jsonify({
+            'job_id': job_id,
+            'cached': False,
+            'result_key': key,
+            'status_url': url_for('job_status', job_id=job_id),
+            'stream_url': url_for('job_stream', job_id=job_id),
+            'detections_url': url_for('job_detections', job_id=job_id),
+            'result_url': url_for('job_result', job_id=job_id)
+        }), 202
 
     return redirect(url_for('index'))
 
-@app.route('/download/<filename>')
+def _job_json(job):
+    """Public view of a job's state."""
+    total = job['total_frames']
+    return {
+        'job_id': job['id'],
+        'status': job['status'],
+        'frames_processed': job['frames_processed'],
+        'total_frames': total,
+        'progress': job['frames_processed'] / total if total else 0.0,
+        'fps': round(job['fps'], 2),
+        'error': job['error'],
+        'stats': job['stats']
+    }
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(_job_json(job))
+
+@app.route('/jobs/<job_id>/stream')
+def job_stream(job_id):
+    """Annotated frames as they are produced, as an MJPEG stream."""
+    if jobs.get(job_id) is None:
+        return jsonify({'error': 'Unknown job'}), 404
+
+    def generate():
+        for _, jpeg, _ in jobs.watch(job_id):
+            yield (b'--frame\r\nContent-Type: image/jpeg\r\n'
+                   b'Content-Length: ' + str(len(jpeg)).encode() + b'\r\n\r\n' + jpeg + b'\r\n')
+
+    return Response(generate(), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+@app.route('/jobs/<job_id>/detections')
+def job_detections(job_id):
+    """Per-frame detections as they are produced, one JSON object per line."""
+    if jobs.get(job_id) is None:
+        return jsonify({'error': 'Unknown job'}), 404
+
+    def generate():
+        for frame_index, _, objects in jobs.watch(job_id):
+            yield json.dumps({'frame': frame_index, 'objects': objects}) + '\n'
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    if job['status'] != 'done':
+        # Still queued / running (or failed): report the status instead
+        return jsonify(_job_json(job)), 202 if job['status'] in ('queued', 'running') else 500
+
+    video_file = os.path.relpath(job['output_path'], app.config['STATIC_FOLDER']).replace(os.sep, '/')
+    return render_template('result.html', video_file=video_file, stats=job['stats'])
+
+@app.route('/results/<key>')
+def stored_result(key):
+    stats = results.get(key)
+    if stats is None:
+        return jsonify({'error': 'Unknown result'}), 404
+    return render_template('result.html', video_file=f'results/{key}.mp4', stats=stats)
+
+@app.route('/download/<path:filename>')
 def download_video(filename):
     return send_from_directory(app.config['STATIC_FOLDER'], filename, as_attachment=True)
 
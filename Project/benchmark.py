@@ -0,0 +1,264 @@
+"""Benchmarks for the video processing pipeline.
+
+Usage:
+    python benchmark.py batch path/to/clip.mp4 --sizes 1 4 8 16
+    python benchmark.py roi path/to/clip.mp4 --padding 32
+    python benchmark.py match --scenes 2000 --motion 30 --detections 50
+    python benchmark.py parallel path/to/clip.mp4 --segments 2 4
+    python benchmark.py scales path/to/clip.mp4 --max-sides 0 1280 960 640
+"""
+import argparse
+import os
+import tempfile
+import time
+from collections import Counter
+
+import cv2
+import numpy as np
+
+from video_processor import (analysis_size, detect_frames, find_motion_boxes, match_detections,
+                             process_video, process_video_parallel, scale_detections,
+                             scale_motion_boxes)
+
+
+def _label(detections, index):
+    return detections['names'][index] if index >= 0 else 'Unknown'
+
+
+def _match_detections_loop(motion_boxes, detections):
+    """Reference pairwise matcher, kept to check match_detections against."""
+    matches = []
+    for x, y, w, h in motion_boxes:
+        mx1, my1, mx2, my2 = x, y, x+w, y+h
+        best_match = -1
+        max_iou = 0.0
+        for i, (yx1, yy1, yx2, yy2) in enumerate(detections['boxes']):
+            ix1 = max(mx1, yx1)
+            iy1 = max(my1, yy1)
+            ix2 = min(mx2, yx2)
+            iy2 = min(my2, yy2)
+            iw = max(0, ix2 - ix1)
+            ih = max(0, iy2 - iy1)
+            intersection = iw * ih
+            union = w * h + (yx2 - yx1) * (yy2 - yy1) - intersection
+            if union > 0:
+                iou = intersection / union
+                if iou > 0.1 and iou > max_iou:
+                    max_iou = iou
+                    best_match = i
+        matches.append(best_match)
+    return matches
+
+
+def _random_scene(rng, n_motion, n_detections, size=(1920, 1080)):
+    width, height = size
+    motion = []
+    for _ in range(n_motion):
+        x, y = int(rng.integers(0, width - 200)), int(rng.integers(0, height - 200))
+        motion.append((x, y, int(rng.integers(20, 200)), int(rng.integers(20, 200))))
+    xy = rng.uniform(0, [width - 200, height - 200], size=(n_detections, 2))
+    wh = rng.uniform(10, 200, size=(n_detections, 2))
+    boxes = np.hstack([xy, xy + wh]).astype(np.float32)
+    # Put some detections right on top of motion boxes so matches happen
+    for i, (x, y, w, h) in enumerate(motion[:n_detections // 2]):
+        boxes[i] = (x + rng.uniform(-5, 5), y + rng.uniform(-5, 5),
+                    x + w + rng.uniform(-5, 5), y + h + rng.uniform(-5, 5))
+    return motion, {'boxes': boxes,
+                    'conf': rng.uniform(0.25, 1.0, n_detections).astype(np.float32),
+                    'names': ['object'] * n_detections}
+
+
+def bench_batch(video_path, sizes):
+    """Report processing fps of process_video for several YOLO batch sizes."""
+    out_dir = tempfile.mkdtemp()
+    baseline = None
+    for size in sizes:
+        output_path = os.path.join(out_dir, f'batch_{size}.mp4')
+        start = time.perf_counter()
+        stats = process_video(video_path, output_path, batch_size=size)
+        elapsed = time.perf_counter() - start
+        fps = stats['total_frames'] / elapsed if elapsed > 0 else 0.0
+        baseline = baseline or fps
+        speedup = fps / baseline if baseline else 0.0
+        print(f"batch_size={size:<3} {elapsed:8.2f}s  {fps:7.2f} fps  x{speedup:.2f}")
+
+
+def bench_roi(video_path, padding, max_frames=0):
+    """Compare full-frame and ROI-cropped detection for speed and label agreement.
+
+    Only frames with motion are timed, since those are the only frames where
+    the two modes differ. Agreement is the share of motion boxes that get the
+    same label in both modes.
+    """
+    cap = cv2.VideoCapture(video_path)
+    backSub = cv2.createBackgroundSubtractorMOG2(history=500, varThreshold=50, detectShadows=True)
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+
+    timings = {'full': 0.0, 'roi': 0.0}
+    frames = agree = total = 0
+    while max_frames <= 0 or frames < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        motion_boxes = find_motion_boxes(backSub, frame, kernel)
+        if not motion_boxes:
+            continue
+        frames += 1
+
+        labels = {}
+        for mode in timings:
+            start = time.perf_counter()
+            detections = detect_frames([frame], [motion_boxes], mode, padding)[0]
+            timings[mode] += time.perf_counter() - start
+            labels[mode] = [_label(detections, i) for i in match_detections(motion_boxes, detections)]
+
+        total += len(motion_boxes)
+        agree += sum(a == b for a, b in zip(labels['full'], labels['roi']))
+    cap.release()
+
+    for mode, elapsed in timings.items():
+        fps = frames / elapsed if elapsed > 0 else 0.0
+        print(f"{mode:<5} {elapsed:8.2f}s  {fps:7.2f} frames/s over {frames} frames with motion")
+    if total:
+        print(f"label agreement: {agree}/{total} motion boxes ({100.0 * agree / total:.1f}%)")
+
+
+def bench_match(scenes, n_motion, n_detections, seed=0):
+    """Check match_detections against the pairwise loop and compare their speed."""
+    rng = np.random.default_rng(seed)
+    data = [_random_scene(rng, n_motion, n_detections) for _ in range(scenes)]
+
+    start = time.perf_counter()
+    expected = [_match_detections_loop(m, d) for m, d in data]
+    loop_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = [match_detections(m, d) for m, d in data]
+    vector_time = time.perf_counter() - start
+
+    mismatches = sum(list(a) != e for a, e in zip(actual, expected))
+    matched = sum(i >= 0 for e in expected for i in e)
+    print(f"loop       {loop_time:8.3f}s")
+    print(f"vectorized {vector_time:8.3f}s  x{loop_time / vector_time:.1f}")
+    print(f"{matched} matches over {scenes} scenes, {mismatches} scenes differ")
+    if mismatches:
+        raise SystemExit(1)
+
+
+def bench_parallel(video_path, segment_counts, batch_size=8):
+    """Compare the serial pipeline with segment-parallel processing."""
+    out_dir = tempfile.mkdtemp()
+
+    start = time.perf_counter()
+    stats = process_video(video_path, os.path.join(out_dir, 'serial.mp4'), batch_size=batch_size)
+    serial = time.perf_counter() - start
+    frames = stats['total_frames']
+    print(f"serial       {serial:8.2f}s  {frames / serial:7.2f} fps")
+
+    for n in segment_counts:
+        start = time.perf_counter()
+        stats = process_video_parallel(video_path, os.path.join(out_dir, f'parallel_{n}.mp4'),
+                                       segments=n, batch_size=batch_size)
+        elapsed = time.perf_counter() - start
+        print(f"segments={stats.get('segments', 1):<3} {elapsed:8.2f}s  {frames / elapsed:7.2f} fps  "
+              f"x{serial / elapsed:.2f}")
+
+
+def bench_scales(video_path, max_sides, max_frames=0):
+    """Compare analysis speed and detections at several analysis resolutions.
+
+    For every frame, motion analysis and YOLO run once per scale. Agreement
+    is the overlap of the labels found in a frame with the labels found at
+    source resolution (multiset Jaccard), averaged over frames where either
+    side found something.
+    """
+    cap = cv2.VideoCapture(video_path)
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+
+    reference = 0
+    max_sides = [reference] + [m for m in max_sides if m != reference]
+    runs = {}
+    for max_side in max_sides:
+        size = analysis_size(width, height, max_side)
+        runs[max_side] = {
+            'size': size,
+            'backSub': cv2.createBackgroundSubtractorMOG2(history=500, varThreshold=50, detectShadows=True),
+            'seconds': 0.0,
+            'agreement': []
+        }
+
+    frames = 0
+    while max_frames <= 0 or frames < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames += 1
+
+        labels = {}
+        for max_side, run in runs.items():
+            start = time.perf_counter()
+            size = run['size']
+            sx, sy = width / size[0], height / size[1]
+            small = frame if size == (width, height) else cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+            small_boxes = find_motion_boxes(run['backSub'], small, kernel, min_area=500 / (sx * sy))
+            detections = scale_detections(detect_frames([small], [small_boxes])[0], sx, sy)
+            motion_boxes = scale_motion_boxes(small_boxes, sx, sy)
+            run['seconds'] += time.perf_counter() - start
+            labels[max_side] = Counter(_label(detections, i) for i in match_detections(motion_boxes, detections))
+
+        for max_side, run in runs.items():
+            ref, got = labels[reference], labels[max_side]
+            union = sum((ref | got).values())
+            if union:
+                run['agreement'].append(sum((ref & got).values()) / union)
+    cap.release()
+
+    for max_side, run in runs.items():
+        fps = frames / run['seconds'] if run['seconds'] > 0 else 0.0
+        agreement = 100.0 * sum(run['agreement']) / len(run['agreement']) if run['agreement'] else 100.0
+        name = 'source' if max_side == reference else f'max_side={max_side}'
+        print(f"{name:<14} {run['size'][0]:>5}x{run['size'][1]:<5} {fps:7.2f} fps  "
+              f"label agreement {agreement:5.1f}%")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('batch', help='compare YOLO batch sizes')
+    p.add_argument('video')
+    p.add_argument('--sizes', type=int, nargs='+', default=[1, 4, 8, 16])
+
+    p = sub.add_parser('roi', help='compare full-frame and ROI-cropped inference')
+    p.add_argument('video')
+    p.add_argument('--padding', type=int, default=32)
+    p.add_argument('--max-frames', type=int, default=0)
+
+    p = sub.add_parser('match', help='check and time the vectorized IoU matcher')
+    p.add_argument('--scenes', type=int, default=2000)
+    p.add_argument('--motion', type=int, default=30)
+    p.add_argument('--detections', type=int, default=50)
+
+    p = sub.add_parser('parallel', help='compare serial and segment-parallel processing')
+    p.add_argument('video')
+    p.add_argument('--segments', type=int, nargs='+', default=[2, 4])
+    p.add_argument('--batch-size', type=int, default=8)
+
+    p = sub.add_parser('scales', help='compare analysis resolutions')
+    p.add_argument('video')
+    p.add_argument('--max-sides', type=int, nargs='+', default=[1280, 960, 640, 480])
+    p.add_argument('--max-frames', type=int, default=0)
+
+    args = parser.parse_args()
+    if args.command == 'batch':
+        bench_batch(args.video, args.sizes)
+    elif args.command == 'roi':
+        bench_roi(args.video, args.padding, args.max_frames)
+    elif args.command == 'match':
+        bench_match(args.scenes, args.motion, args.detections)
+    elif args.command == 'parallel':
+        bench_parallel(args.video, args.segments, args.batch_size)
+    elif args.command == 'scales':
+        bench_scales(args.video, args.max_sides, args.max_frames)
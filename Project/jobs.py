@@ -0,0 +1,289 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+
+def _init_worker(threads):
+    """Limit the threads each worker uses so parallel jobs don't oversubscribe the CPU."""
+    from video_processor import limit_threads
+    limit_threads(threads)
+
+
+def _update(jobs, job_id, **fields):
+    # Manager dict values are copies, so write back the whole record
+    state = dict(jobs[job_id])
+    state.update(fields)
+    jobs[job_id] = state
+
+
+def _offer(frames, item):
+    """Put ``item`` on the bounded ``frames`` queue, dropping the oldest frame if it is full."""
+    while True:
+        try:
+            frames.put_nowait(item)
+            return
+        except queue.Full:
+            try:
+                frames.get_nowait()
+            except queue.Empty:
+                pass
+
+
+def _run_job(jobs, job_id, input_path, output_path, options, viewers=None, frames=None):
+    """Worker entry point: process one video and record progress in ``jobs``.
+
+    While ``viewers`` has a count for this job, annotated frames are
+    JPEG-encoded and offered to the ``frames`` queue together with their
+    detections (see ``JobManager.watch``).
+
+    Returns the stats, or None if processing failed.
+    """
+    import cv2
+    from video_processor import process_video, process_video_parallel
+
+    start = time.perf_counter()
+    _update(jobs, job_id, status='running')
+    # Re-checked after every batch, so frames are only encoded while watched
+    watched = False
+
+    def progress(frames_done, total_frames):
+        nonlocal watched
+        elapsed = time.perf_counter() - start
+        _update(jobs, job_id,
+                frames_processed=frames_done,
+                total_frames=total_frames,
+                fps=frames_done / elapsed if elapsed > 0 else 0.0)
+        watched = frames is not None and viewers.get(job_id, 0) > 0
+
+    def on_frame(frame_index, frame, objects):
+        if not watched:
+            return
+        ok, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 70])
+        if ok:
+            _offer(frames, (frame_index, jpeg.tobytes(), objects))
+
+    segments = options.pop('segments', 1)
+    try:
+        if segments > 1:
+            # Segments run in their own processes, so they are not streamed
+            stats = process_video_parallel(input_path, output_path, segments=segments,
+                                           progress=progress, **options)
+        else:
+            stats = process_video(input_path, output_path, progress=progress,
+                                  on_frame=on_frame, **options)
+    except Exception as e:
+        _update(jobs, job_id, status='failed', error=str(e))
+        return
+    finally:
+        if frames is not None:
+            # End of stream
+            _offer(frames, None)
+    if stats is None:
+        _update(jobs, job_id, status='failed', error='Error opening video stream or file')
+        return
+    _update(jobs, job_id, status='done', stats=stats,
+            elapsed=time.perf_counter() - start)
+    return stats
+
+
+class FrameFeed:
+    """The latest annotated frames of one job, shared by everyone watching it.
+
+    A background thread moves ``(frame_index, jpeg, objects)`` items from the
+    worker's queue into a ring buffer of ``size`` frames. Each viewer reads
+    the buffer at its own pace; a viewer that falls behind skips the frames
+    that have already been overwritten, so memory stays bounded however
+    slow the clients are.
+    """
+
+    def __init__(self, source, size, is_finished):
+        self._source = source
+        self._is_finished = is_finished
+        self._frames = deque(maxlen=max(1, int(size)))
+        self._cond = threading.Condition()
+        self._seq = 0
+        self.closed = False
+        threading.Thread(target=self._pump, daemon=True).start()
+
+    def _pump(self):
+        while True:
+            try:
+                item = self._source.get(timeout=1.0)
+            except queue.Empty:
+                if self._is_finished():
+                    break
+                continue
+            except (EOFError, OSError):
+                break
+            if item is None:
+                break
+            with self._cond:
+                self._seq += 1
+                self._frames.append((self._seq, item))
+                self._cond.notify_all()
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def __iter__(self):
+        with self._cond:
+            # Start at the newest frame rather than replaying the buffer
+            last = self._frames[-1][0] - 1 if self._frames else 0
+        while True:
+            with self._cond:
+                while not self.closed and (not self._frames or self._frames[-1][0] <= last):
+                    self._cond.wait(timeout=1.0)
+                pending = [(seq, item) for seq, item in self._frames if seq > last]
+                if not pending and self.closed:
+                    return
+            for seq, item in pending:
+                last = seq
+                yield item
+
+
+class JobManager:
+    """Runs process_video jobs in a local process pool.
+
+    At most ``max_workers`` videos are processed at once; further jobs wait
+    in the pool's queue. Job state lives in a multiprocessing Manager dict so
+    the workers can report progress back to the web process. The pool and
+    the manager are created on first use, which keeps importing this module
+    cheap in the worker processes themselves.
+
+    Running jobs can be watched live with ``watch``: each job gets a Manager
+    queue of at most ``stream_buffer`` frames, which the worker only fills
+    while someone is watching.
+
+    The state of a finished job is kept for ``job_ttl`` seconds (0 = for
+    good), then the job is forgotten.
+    """
+
+    def __init__(self, max_workers=2, stream_buffer=16, job_ttl=3600):
+        self.max_workers = max(1, int(max_workers))
+        self.stream_buffer = max(1, int(stream_buffer))
+        self.job_ttl = job_ttl
+        self._finished_at = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self._manager = None
+        self._jobs = None
+        self._viewers = None
+        self._frame_queues = {}
+        self._feeds = {}
+
+    def _start(self):
+        with self._lock:
+            if self._executor is None:
+                ctx = multiprocessing.get_context('spawn')
+                threads = max(1, (os.cpu_count() or 1) // self.max_workers)
+                self._manager = ctx.Manager()
+                self._jobs = self._manager.dict()
+                self._viewers = self._manager.dict()
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers, mp_context=ctx,
+                    initializer=_init_worker, initargs=(threads,))
+
+    @staticmethod
+    def new_id():
+        return uuid.uuid4().hex
+
+    def submit(self, input_path, output_path, job_id=None, on_complete=None, **options):
+        """Queue a video for processing and return its job ID.
+
+        ``on_complete(stats)`` is called in this process once the job has
+        finished; ``stats`` is None if it failed.
+        """
+        self._start()
+        self._expire()
+        job_id = job_id or self.new_id()
+        self._jobs[job_id] = {
+            'id': job_id,
+            'status': 'queued',
+            'output_path': output_path,
+            'frames_processed': 0,
+            'total_frames': 0,
+            'fps': 0.0,
+            'stats': None,
+            'error': None
+        }
+        frames = self._manager.Queue(maxsize=self.stream_buffer)
+        with self._lock:
+            self._frame_queues[job_id] = frames
+        future = self._executor.submit(_run_job, self._jobs, job_id, input_path, output_path, options,
+                                       self._viewers, frames)
+        future.add_done_callback(lambda f: self._on_done(job_id, f, on_complete))
+        return job_id
+
+    def _on_done(self, job_id, future, on_complete):
+        # Covers failures outside process_video, e.g. a worker that died
+        error = future.exception()
+        if error is not None:
+            _update(self._jobs, job_id, status='failed', error=str(error))
+        with self._lock:
+            self._frame_queues.pop(job_id, None)
+            self._finished_at[job_id] = time.monotonic()
+        if on_complete:
+            on_complete(future.result() if error is None else None)
+        self._expire()
+
+    def _expire(self):
+        """Forget the jobs that finished more than ``job_ttl`` seconds ago."""
+        if not self.job_ttl:
+            return
+        now = time.monotonic()
+        with self._lock:
+            expired = [job_id for job_id, finished in self._finished_at.items()
+                       if now - finished > self.job_ttl]
+            for job_id in expired:
+                del self._finished_at[job_id]
+        for job_id in expired:
+            self._jobs.pop(job_id, None)
+
+    def get(self, job_id):
+        """Return a copy of the job's state, or None for an unknown ID."""
+        if self._jobs is None:
+            return None
+        state = self._jobs.get(job_id)
+        return dict(state) if state is not None else None
+
+    def _finished(self, job_id):
+        state = self.get(job_id)
+        return state is None or state['status'] in ('done', 'failed')
+
+    def _add_viewer(self, job_id, delta):
+        # Only this process writes the viewer counts, so the lock is enough
+        with self._lock:
+            count = self._viewers.get(job_id, 0) + delta
+            if count > 0:
+                self._viewers[job_id] = count
+            else:
+                self._viewers.pop(job_id, None)
+
+    def watch(self, job_id):
+        """Yield ``(frame_index, jpeg_bytes, objects)`` as the job annotates frames.
+
+        Stops when the job has finished; yields nothing for unknown or
+        finished jobs. Frames are produced from the moment the first viewer
+        starts watching.
+        """
+        with self._lock:
+            feed = self._feeds.get(job_id)
+            if feed is None or feed.closed:
+                frames = self._frame_queues.get(job_id)
+                if frames is None:
+                    return
+                feed = FrameFeed(frames, self.stream_buffer, lambda: self._finished(job_id))
+                self._feeds[job_id] = feed
+        self._add_viewer(job_id, 1)
+        try:
+            yield from feed
+        finally:
+            self._add_viewer(job_id, -1)
+            with self._lock:
+                if feed.closed and self._feeds.get(job_id) is feed:
+                    del self._feeds[job_id]
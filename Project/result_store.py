@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+import threading
+
+
+class ResultStore:
+    """Content-addressed storage for processed videos and their stats.
+
+    A result is keyed by the SHA-256 of the uploaded video plus the
+    processing parameters, and stored as ``<key>.mp4`` / ``<key>.json`` in
+    ``root``. Since the file name changes whenever the content does, results
+    never overwrite each other and can be cached by browsers and proxies.
+    When the store grows past ``max_bytes``, the least recently used results
+    are deleted.
+    """
+
+    def __init__(self, root, max_bytes=2 * 1024 ** 3):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def key_for(video_path, params):
+        """Hash the video file and the processing parameters into a result key."""
+        h = hashlib.sha256()
+        with open(video_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(chunk)
+        h.update(json.dumps(params, sort_keys=True).encode('utf-8'))
+        return h.hexdigest()
+
+    def video_path(self, key):
+        return os.path.join(self.root, key + '.mp4')
+
+    def stats_path(self, key):
+        return os.path.join(self.root, key + '.json')
+
+    def get(self, key):
+        """Return the stored stats for ``key``, or None if there is no result."""
+        try:
+            with open(self.stats_path(key)) as f:
+                stats = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not os.path.exists(self.video_path(key)):
+            return None
+        # Mark as recently used for eviction
+        try:
+            os.utime(self.stats_path(key))
+        except OSError:
+            # Evicted meanwhile
+            return None
+        return stats
+
+    def put(self, key, stats):
+        """Record the stats of a finished result (the video is already written)."""
+        tmp_path = self.stats_path(key) + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(stats, f)
+        os.replace(tmp_path, self.stats_path(key))
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        """Delete least recently used results until the store fits in ``max_bytes``."""
+        with self._lock:
+            entries = []
+            total = 0
+            for name in os.listdir(self.root):
+                if not name.endswith('.json'):
+                    continue
+                key = name[:-len('.json')]
+                try:
+                    used = os.path.getmtime(self.stats_path(key))
+                    size = os.path.getsize(self.stats_path(key))
+                    if os.path.exists(self.video_path(key)):
+                        size += os.path.getsize(self.video_path(key))
+                except OSError:
+                    continue
+                entries.append((used, key, size))
+                total += size
+
+            for _, key, size in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if key == keep:
+                    continue
+                for path in (self.stats_path(key), self.video_path(key)):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                total -= size
@@ -0,0 +1,87 @@
+import csv
+import json
+import threading
+import time
+from array import array
+
+import numpy as np
+
+
+class StageTimer:
+    """Collects per-frame timings for each stage of the video pipeline.
+
+    Every sample is one frame's time in a stage, in seconds. Stages that
+    work on a whole batch (YOLO) spread the batch time evenly over its
+    frames. Samples may be added from several threads.
+    """
+
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self._end = None
+
+    def add(self, stage, seconds, frames=1):
+        """Record ``seconds`` spent on ``frames`` frames in ``stage``."""
+        if frames <= 0:
+            return
+        with self._lock:
+            self.samples.setdefault(stage, array('d')).extend([seconds / frames] * frames)
+
+    def merge(self, samples):
+        """Add the samples of another timer (e.g. from a worker process)."""
+        with self._lock:
+            for stage, values in samples.items():
+                self.samples.setdefault(stage, array('d')).extend(values)
+
+    def stop(self):
+        self._end = time.perf_counter()
+
+    @property
+    def wall_seconds(self):
+        return (self._end or time.perf_counter()) - self._start
+
+    def summary(self):
+        """Totals and p50 / p95 / p99 per stage, in milliseconds per frame."""
+        stages = {}
+        with self._lock:
+            items = [(stage, np.array(values)) for stage, values in self.samples.items()]
+        for stage, values in items:
+            total = float(values.sum())
+            p50, p95, p99 = np.percentile(values, [50, 95, 99]) * 1000.0
+            stages[stage] = {
+                'frames': int(values.size),
+                'total_s': round(total, 4),
+                'mean_ms': round(total / values.size * 1000.0, 3),
+                'p50_ms': round(float(p50), 3),
+                'p95_ms': round(float(p95), 3),
+                'p99_ms': round(float(p99), 3),
+                'frames_per_s': round(values.size / total, 2) if total > 0 else None
+            }
+        return stages
+
+    def write_trace(self, path):
+        """Write every sample to ``path``; CSV if it ends in ``.csv``, else JSON.
+
+        Samples are numbered per stage in the order they were recorded.
+        Stages don't see the same frames (YOLO skips frames without motion,
+        merged segments follow each other), so equal sample numbers of two
+        stages are not necessarily the same video frame.
+        """
+        with self._lock:
+            samples = {stage: list(values) for stage, values in self.samples.items()}
+        if path.endswith('.csv'):
+            with open(path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['stage', 'sample', 'ms'])
+                for stage, values in samples.items():
+                    for i, seconds in enumerate(values):
+                        writer.writerow([stage, i, round(seconds * 1000.0, 4)])
+        else:
+            with open(path, 'w') as f:
+                json.dump({
+                    'wall_seconds': self.wall_seconds,
+                    'summary': self.summary(),
+                    'samples_ms': {stage: [round(s * 1000.0, 4) for s in values]
+                                   for stage, values in samples.items()}
+                }, f)
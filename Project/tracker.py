@@ -0,0 +1,136 @@
+from collections import Counter
+
+import numpy as np
+
+
+def iou_matrix(a, b):
+    """IoU between every pair of ``(x, y, w, h)`` boxes in ``a`` and ``b``."""
+    a = np.asarray(a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float64).reshape(-1, 4)
+    ax1, ay1 = a[:, 0:1], a[:, 1:2]
+    ax2, ay2 = ax1 + a[:, 2:3], ay1 + a[:, 3:4]
+    bx1, by1 = b[:, 0], b[:, 1]
+    bx2, by2 = bx1 + b[:, 2], by1 + b[:, 3]
+
+    iw = np.maximum(0, np.minimum(ax2, bx2) - np.maximum(ax1, bx1))
+    ih = np.maximum(0, np.minimum(ay2, by2) - np.maximum(ay1, by1))
+    intersection = iw * ih
+    union = a[:, 2:3] * a[:, 3:4] + b[:, 2] * b[:, 3] - intersection
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(union > 0, intersection / union, 0.0)
+
+
+class Track:
+    """A moving object followed across frames."""
+
+    def __init__(self, track_id, box, frame_index):
+        self.id = track_id
+        self.box = box
+        self.first_frame = frame_index
+        self.last_frame = frame_index
+        self.frames = 1
+        self.missed = 0
+        # Latest YOLO label, kept until a newer detection replaces it
+        self.label = None
+        self.conf = 0.0
+        self.label_counts = Counter()
+        # Frame of the last detection scheduled for this track
+        self.detected_at = None
+
+    def set_label(self, name, conf):
+        """Store a YOLO label matched to this track's motion box."""
+        self.label = name
+        self.conf = conf
+        self.label_counts[name] += 1
+
+    def summary(self):
+        label = self.label_counts.most_common(1)[0][0] if self.label_counts else 'Unknown'
+        return {
+            'id': self.id,
+            'label': label,
+            'first_frame': self.first_frame,
+            'last_frame': self.last_frame,
+            'frames': self.frames
+        }
+
+
+class MotionTracker:
+    """IoU tracker over the per-frame motion boxes.
+
+    Each motion box is associated greedily with the active track whose last
+    box overlaps it most (IoU above ``iou_threshold``); unmatched boxes start
+    new tracks and tracks unseen for more than ``max_missed`` frames are
+    retired. A track asks for YOLO when it is new or when its label is older
+    than ``relabel_every`` frames, so a stable object is detected once and its
+    label is reused on the frames in between.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_missed=10, relabel_every=30, min_frames=3):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.relabel_every = relabel_every
+        self.min_frames = min_frames
+        self.active = []
+        self.retired = []
+        self.next_id = 1
+
+    def update(self, motion_boxes, frame_index):
+        """Associate this frame's motion boxes with tracks.
+
+        Returns the track of each motion box, in the same order.
+        """
+        assigned = [None] * len(motion_boxes)
+        matched_tracks = set()
+
+        if self.active and motion_boxes:
+            iou = iou_matrix([t.box for t in self.active], motion_boxes)
+            # Greedy: best overlapping pairs first
+            for flat in np.argsort(-iou, axis=None):
+                ti, bi = (int(i) for i in np.unravel_index(flat, iou.shape))
+                if iou[ti, bi] <= self.iou_threshold:
+                    break
+                if ti in matched_tracks or assigned[bi] is not None:
+                    continue
+                track = self.active[ti]
+                track.box = motion_boxes[bi]
+                track.last_frame = frame_index
+                track.frames += 1
+                track.missed = 0
+                matched_tracks.add(ti)
+                assigned[bi] = track
+
+        still_active = []
+        for ti, track in enumerate(self.active):
+            if ti not in matched_tracks:
+                track.missed += 1
+                if track.missed > self.max_missed:
+                    self.retired.append(track)
+                    continue
+            still_active.append(track)
+        self.active = still_active
+
+        for bi, box in enumerate(motion_boxes):
+            if assigned[bi] is None:
+                track = Track(self.next_id, box, frame_index)
+                self.next_id += 1
+                self.active.append(track)
+                assigned[bi] = track
+
+        return assigned
+
+    def needs_detection(self, tracks, frame_index):
+        """Return True if any of ``tracks`` is new or has a stale label.
+
+        The tracks are marked as scheduled for this frame, so later frames of
+        the same batch do not ask for them again.
+        """
+        stale = [t for t in tracks
+                 if t.detected_at is None or frame_index - t.detected_at >= self.relabel_every]
+        for track in stale:
+            track.detected_at = frame_index
+        return bool(stale)
+
+    def summary(self):
+        """Per-track summary, skipping tracks shorter than ``min_frames``."""
+        tracks = sorted(self.retired + self.active, key=lambda t: t.id)
+        return [t.summary() for t in tracks if t.frames >= self.min_frames]
@@ -0,0 +1,641 @@
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+from ultralytics import YOLO
+from tracker import MotionTracker
+from timing import StageTimer
+
+_model = None
+
+def get_model():
+    """Load the YOLO model on first use (once per process)."""
+    global _model
+    if _model is None:
+        _model = YOLO('yolov8n.pt')
+    return _model
+
+def find_motion_boxes(backSub, frame, kernel, min_area=500, timer=None):
+    """Run background subtraction on a frame and return the moving regions.
+
+    Returns the ``(x, y, w, h)`` bounding rects of contours whose area is at
+    least ``min_area``; smaller blobs are treated as noise. Stage times are
+    recorded on ``timer`` if given.
+    """
+    t0 = time.perf_counter()
+    # 1. Background Subtraction
+    fgMask = backSub.apply(frame)
+    t1 = time.perf_counter()
+
+    # Cleanup mask (remove noise/shadows)
+    _, fgMask = cv2.threshold(fgMask, 250, 255, cv2.THRESH_BINARY)
+    fgMask = cv2.morphologyEx(fgMask, cv2.MORPH_OPEN, kernel)
+    fgMask = cv2.dilate(fgMask, kernel, iterations=2)
+    t2 = time.perf_counter()
+
+    # 2. Find Contours (Moving Objects)
+    contours, _ = cv2.findContours(fgMask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    boxes = []
+    for cnt in contours:
+        area = cv2.contourArea(cnt)
+        if area < min_area: # Filter small movements
+            continue
+        boxes.append(cv2.boundingRect(cnt))
+
+    if timer:
+        timer.add('mog2', t1 - t0)
+        timer.add('morphology', t2 - t1)
+        timer.add('contours', time.perf_counter() - t2)
+    return boxes
+
+def merge_motion_regions(motion_boxes, frame_shape, padding=32):
+    """Pad motion boxes and merge the overlapping ones into crop regions.
+
+    Returns a list of ``(x1, y1, x2, y2)`` regions clipped to the frame.
+    """
+    height, width = frame_shape[:2]
+    regions = [[max(0, x - padding), max(0, y - padding),
+                min(width, x + w + padding), min(height, y + h + padding)]
+               for x, y, w, h in motion_boxes]
+
+    # Keep merging until no two regions overlap
+    merged = True
+    while merged:
+        merged = False
+        result = []
+        for r in regions:
+            for m in result:
+                if r[0] < m[2] and m[0] < r[2] and r[1] < m[3] and m[1] < r[3]:
+                    m[0], m[1] = min(m[0], r[0]), min(m[1], r[1])
+                    m[2], m[3] = max(m[2], r[2]), max(m[3], r[3])
+                    merged = True
+                    break
+            else:
+                result.append(r)
+        regions = result
+
+    return [tuple(r) for r in regions]
+
+def no_detections():
+    """Return an empty detections dict (see ``extract_detections``)."""
+    return {'boxes': np.zeros((0, 4), dtype=np.float32),
+            'conf': np.zeros(0, dtype=np.float32),
+            'names': []}
+
+def extract_detections(result, offset=(0, 0)):
+    """Convert a single YOLO result into a detections dict.
+
+    The dict holds all boxes of the result as one ``(N, 4)`` xyxy array,
+    their confidences as an ``(N,)`` array and the class names as a list.
+    ``offset`` is added to the box coordinates, to map detections made on a
+    crop back onto the full frame.
+    """
+    boxes = result.boxes
+    xyxy = boxes.xyxy.cpu().numpy()
+    if offset != (0, 0):
+        ox, oy = offset
+        xyxy = xyxy + np.array([ox, oy, ox, oy], dtype=xyxy.dtype)
+    return {'boxes': xyxy,
+            'conf': boxes.conf.cpu().numpy(),
+            'names': [get_model().names[int(c)] for c in boxes.cls.cpu().numpy()]}
+
+def concat_detections(detections):
+    """Join several detections dicts (e.g. from the crops of one frame)."""
+    if not detections:
+        return no_detections()
+    return {'boxes': np.concatenate([d['boxes'] for d in detections]),
+            'conf': np.concatenate([d['conf'] for d in detections]),
+            'names': [name for d in detections for name in d['names']]}
+
+def detect_frames(frames, frame_motion, inference_mode='full', roi_padding=32):
+    """Run YOLO over a batch of frames and return one detections dict per frame.
+
+    In ``'full'`` mode every frame goes to the model as is. In ``'roi'`` mode
+    only the padded, merged motion regions are cropped out and sent to the
+    model (all crops of the batch in one call); their boxes are shifted back
+    into frame coordinates. A frame without motion is detected in full.
+    """
+    if not frames:
+        return []
+    model = get_model()
+    if inference_mode != 'roi':
+        return [extract_detections(r) for r in model(frames, verbose=False)]
+
+    crops = []
+    owners = []
+    for i, (frame, motion_boxes) in enumerate(zip(frames, frame_motion)):
+        height, width = frame.shape[:2]
+        regions = merge_motion_regions(motion_boxes, frame.shape, roi_padding) or [(0, 0, width, height)]
+        for x1, y1, x2, y2 in regions:
+            crops.append(frame[y1:y2, x1:x2])
+            owners.append((i, (x1, y1)))
+
+    per_frame = [[] for _ in frames]
+    for (i, offset), r in zip(owners, model(crops, verbose=False)):
+        per_frame[i].append(extract_detections(r, offset))
+    return [concat_detections(d) for d in per_frame]
+
+def match_detections(motion_boxes, detections, iou_threshold=0.1):
+    """Return the index of the best matching detection for each motion box.
+
+    The IoU between every ``(x, y, w, h)`` motion box and every detection is
+    computed at once as an ``(M, N)`` matrix. A detection only matches when
+    its IoU is above ``iou_threshold``; the highest IoU wins, ties go to the
+    earlier detection. Unmatched motion boxes get ``-1``.
+    """
+    boxes = detections['boxes']
+    if len(motion_boxes) == 0:
+        return np.zeros(0, dtype=int)
+    if len(boxes) == 0:
+        return np.full(len(motion_boxes), -1)
+
+    # Same float32 arithmetic as the YOLO boxes themselves
+    m = np.asarray(motion_boxes, dtype=np.float32)
+    mx1, my1 = m[:, 0:1], m[:, 1:2]
+    mx2, my2 = mx1 + m[:, 2:3], my1 + m[:, 3:4]
+    yx1, yy1, yx2, yy2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+
+    # Intersection
+    iw = np.maximum(0, np.minimum(mx2, yx2) - np.maximum(mx1, yx1))
+    ih = np.maximum(0, np.minimum(my2, yy2) - np.maximum(my1, yy1))
+    intersection = iw * ih
+
+    # Union
+    motion_area = m[:, 2:3] * m[:, 3:4]
+    yolo_area = (yx2 - yx1) * (yy2 - yy1)
+    union = motion_area + yolo_area - intersection
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        iou = np.where(union > 0, intersection / union, 0)
+    iou = np.where(iou > np.float32(iou_threshold), iou, 0)
+
+    best = iou.argmax(axis=1)
+    best[iou[np.arange(len(best)), best] <= 0] = -1
+    return best
+
+def annotate_frame(frame, motion_boxes, detections, tracks=None, timer=None):
+    """Match motion boxes to YOLO detections and draw the labels in place.
+
+    When ``tracks`` (one per motion box) is given, matched labels are stored
+    on the tracks and each box is drawn with its track ID and the track's
+    latest label, so labels carry over frames that were not detected.
+
+    Returns one dict per motion box with its ``box`` (x, y, w, h), ``label``
+    and ``conf`` (None when unmatched), plus ``track_id`` when tracking.
+    """
+    t0 = time.perf_counter()
+    # 4. Match Motion to YOLO
+    matches = match_detections(motion_boxes, detections)
+    t1 = time.perf_counter()
+
+    objects = []
+    for i, ((x, y, w, h), best) in enumerate(zip(motion_boxes, matches)):
+        name, conf = None, 0.0
+        if best >= 0:
+            name, conf = detections['names'][best], float(detections['conf'][best])
+
+        if tracks is not None:
+            track = tracks[i]
+            if name:
+                track.set_label(name, conf)
+            name, conf = track.label, track.conf
+
+        # Draw
+        color = (255, 255, 255) # White
+        cv2.rectangle(frame, (x, y), (x+w, y+h), color, 2)
+
+        label = ""
+        if name:
+            label = f"{name} ({conf:.2f})"
+        else:
+            label = "Unknown"
+        if tracks is not None:
+            label = f"#{tracks[i].id} {label}"
+
+        cv2.putText(frame, label, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+
+        obj = {'box': [int(x), int(y), int(w), int(h)],
+               'label': name or 'Unknown',
+               'conf': round(conf, 4) if name else None}
+        if tracks is not None:
+            obj['track_id'] = tracks[i].id
+        objects.append(obj)
+
+    if timer:
+        timer.add('matching', t1 - t0)
+        timer.add('drawing', time.perf_counter() - t1)
+    return objects
+
+def analysis_size(width, height, max_side):
+    """Return the ``(width, height)`` a frame is analysed at for ``max_side``.
+
+    Frames whose longer side exceeds ``max_side`` are scaled down, keeping
+    the aspect ratio; a falsy ``max_side`` keeps the source resolution.
+    """
+    if not max_side or max(width, height) <= max_side:
+        return width, height
+    scale = max_side / max(width, height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def scale_motion_boxes(motion_boxes, sx, sy):
+    """Scale ``(x, y, w, h)`` motion boxes by ``sx`` / ``sy``."""
+    return [(int(round(x * sx)), int(round(y * sy)), int(round(w * sx)), int(round(h * sy)))
+            for x, y, w, h in motion_boxes]
+
+def scale_detections(detections, sx, sy):
+    """Scale the boxes of a detections dict by ``sx`` / ``sy``."""
+    factors = np.array([sx, sy, sx, sy], dtype=np.float32)
+    return dict(detections, boxes=detections['boxes'] * factors)
+
+def _put(q, item, stop):
+    """Put ``item`` on a bounded queue, giving up once ``stop`` is set."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _decode_frames(cap, frames_out, stop, max_frames=None, timer=None):
+    """Decoder stage: read frames into ``frames_out``, then a ``None`` sentinel."""
+    try:
+        count = 0
+        while not stop.is_set() and (max_frames is None or count < max_frames):
+            start = time.perf_counter()
+            ret, frame = cap.read()
+            if timer and ret:
+                timer.add('decode', time.perf_counter() - start)
+            if not ret:
+                break
+            if not _put(frames_out, frame, stop):
+                break
+            count += 1
+    finally:
+        _put(frames_out, None, stop)
+
+def _encode_frames(out, frames_in, timer=None):
+    """Encoder stage: write frames from ``frames_in`` until the ``None`` sentinel."""
+    while True:
+        frame = frames_in.get()
+        if frame is None:
+            break
+        start = time.perf_counter()
+        out.write(frame)
+        if timer:
+            timer.add('encode', time.perf_counter() - start)
+
+def _open_writer(output_path, fps, size):
+    """Open a VideoWriter for ``output_path``."""
+    # Try 'avc1' for better browser compatibility, fallback to 'mp4v'
+    fourcc = cv2.VideoWriter_fourcc(*'avc1')
+    out = cv2.VideoWriter(output_path, fourcc, fps, size)
+    if not out.isOpened():
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        out = cv2.VideoWriter(output_path, fourcc, fps, size)
+    return out
+
+def limit_threads(threads):
+    """Cap the threads OpenCV and torch use in this process."""
+    cv2.setNumThreads(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+def process_video(input_path, output_path, batch_size=1,
+                  decode_queue_size=32, encode_queue_size=32,
+                  motion_gating=False, detect_every=0,
+                  inference_mode='full', roi_padding=32,
+                  track=False, relabel_every=30, progress=None,
+                  start_frame=0, end_frame=None, warmup_frames=0,
+                  timer=None, trace_path=None, max_side=0, on_frame=None):
+    """Annotate moving objects in a video.
+
+    Decoding and encoding run on their own threads, connected to the
+    detection stage by bounded FIFO queues (``decode_queue_size`` and
+    ``encode_queue_size`` frames), so I/O overlaps with inference while
+    frames stay in order.
+
+    Frames are buffered in groups of ``batch_size`` and passed to YOLO in a
+    single call, which amortises the per-call overhead on CPU. Background
+    subtraction and drawing still run frame by frame, in order, so the output
+    is the same as with ``batch_size=1``.
+
+    With ``motion_gating`` enabled, YOLO only sees frames that contain at
+    least one qualifying motion box; the rest have nothing to label, so the
+    annotated output does not change. ``detect_every=K`` also runs detection
+    on every K-th frame that has motion boxes (0 disables it); this only
+    matters with ``track``, where it relabels all tracks on that frame.
+
+    ``inference_mode='roi'`` runs YOLO on crops around the motion regions
+    (padded by ``roi_padding`` pixels) instead of the full frame, see
+    ``detect_frames``.
+
+    With ``track`` enabled, motion boxes are followed across frames by a
+    ``MotionTracker``. YOLO then only runs when a track is new or its label
+    is older than ``relabel_every`` frames; boxes are drawn with their track
+    ID and the stats include a per-track summary.
+
+    ``progress``, if given, is called as ``progress(frames_done, total_frames)``
+    after every batch.
+
+    ``start_frame`` / ``end_frame`` restrict the output to that frame range.
+    Up to ``warmup_frames`` frames before ``start_frame`` are fed to the
+    background subtractor only, so a segment starts with a trained model
+    (see ``process_video_parallel``).
+
+    Per-frame times of every stage (decode, resize, mog2, morphology,
+    contours, yolo, matching, drawing, encode) are collected on ``timer`` (a new
+    ``StageTimer`` by default); their p50/p95/p99 summary is returned under
+    ``stats['timings']``. ``trace_path`` additionally writes all samples to
+    a JSON or CSV file.
+
+    ``max_side`` runs motion analysis and detection on a copy of each frame
+    scaled down so its longer side is at most ``max_side`` pixels. The
+    motion and YOLO boxes are scaled back up, and drawing and encoding
+    happen on the full-resolution frame. 0 analyses at source resolution.
+
+    ``on_frame``, if given, is called as ``on_frame(frame_index, frame, objects)``
+    for every annotated frame as soon as it is drawn, before it is encoded,
+    with the labelled objects returned by ``annotate_frame``. It runs on the
+    detection thread, so it should hand the frame off rather than block.
+    """
+    timer = timer or StageTimer()
+    cap = cv2.VideoCapture(input_path)
+    if not cap.isOpened():
+        print("Error opening video stream or file")
+        return
+
+    # Video properties
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = int(cap.get(cv2.CAP_PROP_FPS))
+    video_frames = max(0, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+
+    # Frame range
+    start_frame = max(0, int(start_frame))
+    warmup = min(max(0, int(warmup_frames)), start_frame)
+    first_frame = start_frame - warmup
+    if first_frame:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, first_frame)
+    max_frames = None if end_frame is None else max(0, int(end_frame) - first_frame)
+    total_frames = max(0, (video_frames if end_frame is None else min(int(end_frame), video_frames)) - start_frame)
+    
+    # Output writer
+    out = _open_writer(output_path, fps, (width, height))
+
+    # Background Subtractor
+    backSub = cv2.createBackgroundSubtractorMOG2(history=500, varThreshold=50, detectShadows=True)
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+    batch_size = max(1, int(batch_size))
+
+    # Analysis resolution, and the factors that map it back to the frame
+    small_size = analysis_size(width, height, max_side)
+    downscale = small_size != (width, height)
+    sx, sy = width / small_size[0], height / small_size[1]
+    min_area = 500 / (sx * sy)
+    small_padding = int(round(roi_padding / sx))
+
+    # Pipeline: decoder thread -> detection (this thread) -> encoder thread
+    stop = threading.Event()
+    decoded = queue.Queue(maxsize=max(1, int(decode_queue_size)))
+    annotated = queue.Queue(maxsize=max(1, int(encode_queue_size)))
+    decoder = threading.Thread(target=_decode_frames, args=(cap, decoded, stop, max_frames, timer), daemon=True)
+    encoder = threading.Thread(target=_encode_frames, args=(out, annotated, timer), daemon=True)
+    decoder.start()
+    encoder.start()
+
+    tracker = MotionTracker(relabel_every=relabel_every) if track else None
+    # (frame, analysis_frame, analysis_boxes, motion_boxes, tracks, run_detection)
+    # in decode order
+    batch = []
+    frame_index = first_frame
+    frames_done = 0
+    detected_frames = 0
+
+    def flush():
+        nonlocal detected_frames, frames_done
+        # 3. YOLO Detection (one call for the frames in the batch that need it)
+        pending = [(small, small_boxes) for _, small, small_boxes, _, _, detect in batch if detect]
+        start = time.perf_counter()
+        results = iter(detect_frames([f for f, _ in pending], [m for _, m in pending],
+                                     inference_mode, small_padding))
+        timer.add('yolo', time.perf_counter() - start, len(pending))
+        detected_frames += len(pending)
+        for i, (frame, _, _, motion_boxes, tracks, detect) in enumerate(batch):
+            detections = next(results) if detect else no_detections()
+            if downscale:
+                detections = scale_detections(detections, sx, sy)
+            objects = annotate_frame(frame, motion_boxes, detections, tracks, timer)
+            if on_frame:
+                on_frame(start_frame + frames_done + i, frame, objects)
+            annotated.put(frame)
+        frames_done += len(batch)
+        batch.clear()
+        if progress:
+            progress(frames_done, total_frames)
+
+    try:
+        while True:
+            frame = decoded.get()
+            if frame is None:
+                break
+
+            small = frame
+            if downscale:
+                start = time.perf_counter()
+                small = cv2.resize(frame, small_size, interpolation=cv2.INTER_AREA)
+                timer.add('resize', time.perf_counter() - start)
+            small_boxes = find_motion_boxes(backSub, small, kernel, min_area=min_area, timer=timer)
+            motion_boxes = scale_motion_boxes(small_boxes, sx, sy) if downscale else small_boxes
+            if frame_index < start_frame:
+                # Warm-up only: train the background model, no output
+                frame_index += 1
+                continue
+
+            # Detections are only used to label motion boxes: a frame without
+            # any has nothing to label, whatever detect_every says
+            forced = detect_every > 0 and frame_index % detect_every == 0 and bool(motion_boxes)
+            if tracker:
+                tracks = tracker.update(motion_boxes, frame_index)
+                detect = tracker.needs_detection(tracks, frame_index) or forced
+            else:
+                tracks = None
+                detect = not motion_gating or bool(motion_boxes) or forced
+            batch.append((frame, small, small_boxes, motion_boxes, tracks, detect))
+            frame_index += 1
+            if len(batch) >= batch_size:
+                flush()
+
+        if batch:
+            flush()
+    finally:
+        stop.set()
+        annotated.put(None)
+        decoder.join()
+        encoder.join()
+        cap.release()
+        out.release()
+
+    cv2.destroyAllWindows()
+    timer.stop()
+    
+    stats = {
+        'width': width,
+        'height': height,
+        'fps': fps,
+        'total_frames': total_frames,
+        'detected_frames': detected_frames,
+        'analysis_width': small_size[0],
+        'analysis_height': small_size[1],
+        'processing_seconds': round(timer.wall_seconds, 3),
+        'processing_fps': round(frames_done / timer.wall_seconds, 2) if timer.wall_seconds > 0 else 0.0,
+        'timings': timer.summary()
+    }
+    if trace_path:
+        timer.write_trace(trace_path)
+    if tracker:
+        stats['tracks'] = tracker.summary()
+        stats['track_count'] = len(stats['tracks'])
+    return stats
+
+def _process_segment(input_path, output_path, start, end, warmup_frames, options):
+    """Worker entry point for ``process_video_parallel``.
+
+    Returns the segment's stats and its raw stage timings.
+    """
+    timer = StageTimer()
+    stats = process_video(input_path, output_path, start_frame=start, end_frame=end,
+                          warmup_frames=warmup_frames, timer=timer, **options)
+    return stats, timer.samples
+
+def _stitch_segments(segment_paths, output_path, fps, size):
+    """Join the encoded segments, in order, into ``output_path``."""
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg:
+        # Same codec and settings in every segment: concatenate without re-encoding
+        list_path = output_path + '.segments.txt'
+        with open(list_path, 'w') as f:
+            for path in segment_paths:
+                f.write(f"file '{os.path.abspath(path)}'\n")
+        try:
+            result = subprocess.run([ffmpeg, '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0',
+                                     '-i', list_path, '-c', 'copy', output_path])
+        finally:
+            os.remove(list_path)
+        if result.returncode == 0:
+            return
+
+    out = _open_writer(output_path, fps, size)
+    try:
+        for path in segment_paths:
+            cap = cv2.VideoCapture(path)
+            try:
+                while True:
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+                    out.write(frame)
+            finally:
+                cap.release()
+    finally:
+        out.release()
+
+def process_video_parallel(input_path, output_path, segments=None, warmup_frames=100,
+                           progress=None, trace_path=None, **options):
+    """Process a long video as time segments in a pool of worker processes.
+
+    The frame range is split into ``segments`` parts (default: one per CPU).
+    Each worker loads its own YOLO model, warms its background subtractor on
+    the ``warmup_frames`` frames before its segment and encodes the segment
+    to a temporary file; the segments are then stitched into
+    ``output_path``. Tracks are not linked across segment boundaries.
+
+    ``options`` are passed on to ``process_video``. Returns the same stats
+    dict, with counts summed over the segments and stage timings merged
+    from all workers.
+    """
+    timer = StageTimer()
+    cap = cv2.VideoCapture(input_path)
+    if not cap.isOpened():
+        print("Error opening video stream or file")
+        return
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = int(cap.get(cv2.CAP_PROP_FPS))
+    total_frames = max(0, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+    cap.release()
+
+    segments = max(1, int(segments or os.cpu_count() or 1))
+    # Short clips aren't worth the pool start-up and the warm-up overhead
+    segments = min(segments, max(1, total_frames // max(1, warmup_frames)))
+    if segments == 1:
+        return process_video(input_path, output_path, progress=progress,
+                             timer=timer, trace_path=trace_path, **options)
+
+    bounds = [total_frames * i // segments for i in range(segments + 1)]
+    tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(output_path)))
+    ext = os.path.splitext(output_path)[1] or '.mp4'
+    segment_paths = [os.path.join(tmp_dir, f'segment_{i:03d}{ext}') for i in range(segments)]
+
+    ctx = multiprocessing.get_context('spawn')
+    threads = max(1, (os.cpu_count() or 1) // segments)
+    try:
+        with ProcessPoolExecutor(max_workers=segments, mp_context=ctx,
+                                 initializer=limit_threads, initargs=(threads,)) as pool:
+            futures = [pool.submit(_process_segment, input_path, path, bounds[i], bounds[i + 1],
+                                   warmup_frames, options)
+                       for i, path in enumerate(segment_paths)]
+            results = []
+            frames_done = 0
+            for i, future in enumerate(futures):
+                segment_stats, samples = future.result()
+                results.append(segment_stats)
+                timer.merge(samples)
+                frames_done += bounds[i + 1] - bounds[i]
+                if progress:
+                    progress(frames_done, total_frames)
+
+        start = time.perf_counter()
+        _stitch_segments(segment_paths, output_path, fps, (width, height))
+        timer.add('stitch', time.perf_counter() - start, total_frames)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    timer.stop()
+
+    stats = {
+        'width': width,
+        'height': height,
+        'fps': fps,
+        'total_frames': total_frames,
+        'detected_frames': sum(r['detected_frames'] for r in results),
+        'analysis_width': results[0]['analysis_width'],
+        'analysis_height': results[0]['analysis_height'],
+        'segments': segments,
+        'processing_seconds': round(timer.wall_seconds, 3),
+        'processing_fps': round(total_frames / timer.wall_seconds, 2) if timer.wall_seconds > 0 else 0.0,
+        'timings': timer.summary()
+    }
+    if trace_path:
+        timer.write_trace(trace_path)
+    if options.get('track'):
+        # Keep track IDs unique by offsetting each segment's IDs
+        tracks = []
+        offset = 0
+        for r in results:
+            for t in r['tracks']:
+                tracks.append(dict(t, id=t['id'] + offset))
+            offset += max((t['id'] for t in r['tracks']), default=0)
+        stats['tracks'] = tracks
+        stats['track_count'] = len(tracks)
+    return stats
@@ -1,8 +1,57 @@
+import gc
+import os
+
 from flask import Flask, render_template, request, jsonify
-from chatbot import AdmissionChatbot
+from chatbot import DEFAULT_KNOWLEDGE_BASE, AdmissionChatbot
 
 app = Flask(__name__)
-bot = AdmissionChatbot()
+# Programs and intent patterns, reloaded when the file changes
+app.config['KNOWLEDGE_BASE'] = os.environ.get('KNOWLEDGE_BASE', DEFAULT_KNOWLEDGE_BASE)
+# Seconds between checks of the knowledge base file (0 = every request, -1 = never)
+app.config['KNOWLEDGE_BASE_CHECK_INTERVAL'] = float(os.environ.get('KNOWLEDGE_BASE_CHECK_INTERVAL', 1.0))
+# Recent messages remembered with their response
+app.config['CHAT_CACHE_SIZE'] = int(os.environ.get('CHAT_CACHE_SIZE', 1024))
+# Most messages accepted by one /chat/batch request
+app.config['CHAT_BATCH_MAX'] = int(os.environ.get('CHAT_BATCH_MAX', 100))
+
+check_interval = app.config['KNOWLEDGE_BASE_CHECK_INTERVAL']
+bot = AdmissionChatbot(app.config['KNOWLEDGE_BASE'],
+                       check_interval=check_interval if check_interval >= 0 else None,
+                       cache_size=app.config['CHAT_CACHE_SIZE'])
+# Keep what was loaded so far out of the garbage collector, so workers
+# forked from a preloaded app (gunicorn --preload) share these pages
+# instead of copying them on the first collection
+gc.freeze()
+
+
+def reply(message, check=True):
+    """The bot's response to one message; ValueError if it isn't a string.
+
+    ``check=False`` skips the check of the knowledge base file (see
+    ``AdmissionChatbot.get_response``).
+    """
+    if not message:
+        return 'Please enter a message.'
+    if not isinstance(message, str):
+        raise ValueError("'message' must be a string")
+    
+    # Get bot response
+    return bot.get_response(message, check=check)
+
+
+def batch_replies(data, check=True):
+    """The responses to the ``messages`` of a batch request, in order.
+
+    Raises ValueError if ``messages`` isn't a list of strings or has more
+    than CHAT_BATCH_MAX of them.
+    """
+    messages = data.get('messages') if isinstance(data, dict) else None
+    if not isinstance(messages, list) or not all(isinstance(m, str) for m in messages):
+        raise ValueError("'messages' must be a list of strings")
+    if len(messages) > app.config['CHAT_BATCH_MAX']:
+        raise ValueError(f"At most {app.config['CHAT_BATCH_MAX']} messages per batch")
+    return [reply(m, check=check) for m in messages]
+
 
 @app.route('/')
 def index():
@@ -14,13 +63,23 @@ def chat():
     data = request.get_json()
     user_message = data.get('message', '')
     
-    if not user_message:
-        return jsonify({'response': 'Please enter a message.'})
-    
-    # Get bot response
-    bot_response = bot.get_response(user_message)
-    
-    return jsonify({'response': bot_response})
+    try:
+        return jsonify({'response': reply(user_message)})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/chat/batch', methods=['POST'])
+def chat_batch():
+    """Handle a list of chat messages in one request."""
+    try:
+        responses = batch_replies(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'responses': responses})
+
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify(bot.stats())
 
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
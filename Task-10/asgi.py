@@ -0,0 +1,147 @@
+"""ASGI entry point, to serve the chatbot from an async server.
+
+    uvicorn asgi:app --workers 4
+
+POST /chat, POST /chat/batch and GET /cache/stats are answered right on
+the event loop, by the same bot and with the same configuration as
+app.py: an answer takes microseconds, less than handing it to a thread.
+The knowledge base file is checked, and rebuilt if it changed, in a
+background thread (``AdmissionChatbot.start_reload``), the only place
+this path checks it, so a reload holds up no request. Everything else
+(the chat page and its static files) is passed to the Flask app, which
+runs in a thread.
+"""
+import asyncio
+import io
+import json
+import sys
+
+from app import app as flask_app, batch_replies, bot, reply
+
+
+async def _read_body(receive):
+    """Return the request body, or None if the client went away."""
+    body = b''
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+def _json(body):
+    try:
+        return json.loads(body)
+    except ValueError:
+        return None
+
+
+async def _respond(send, status, headers, body):
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _respond_json(send, data, status=200):
+    body = json.dumps(data).encode('utf-8')
+    await _respond(send, status, [(b'content-type', b'application/json'),
+                                  (b'content-length', str(len(body)).encode('latin-1'))], body)
+
+
+def _app_path(scope):
+    """The request path below the prefix the app is mounted at (``root_path``)."""
+    path, root_path = scope['path'], scope.get('root_path', '')
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    return path or '/'
+
+
+def _call_wsgi(scope, body):
+    """Run one request through the Flask app; return its status, headers and body."""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': _app_path(scope).encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        value = value.decode('latin-1')
+        if name in environ:
+            # Repeated headers are joined; cookies with their own separator
+            value = f"{environ[name]}{'; ' if name == 'HTTP_COOKIE' else ','}{value}"
+        environ[name] = value
+
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+
+    result = flask_app.wsgi_app(environ, start_response)
+    try:
+        content = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return response['status'], response['headers'], content
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if scope['type'] != 'http':
+        return
+
+    body = await _read_body(receive)
+    if body is None:
+        return
+    method, path = scope['method'], _app_path(scope)
+
+    if path == '/chat' and method == 'POST':
+        data = _json(body)
+        if not isinstance(data, dict):
+            await _respond_json(send, {'error': 'Expected a JSON object with a message'}, 400)
+            return
+        bot.start_reload()
+        try:
+            response = reply(data.get('message', ''), check=False)
+        except ValueError as e:
+            await _respond_json(send, {'error': str(e)}, 400)
+            return
+        await _respond_json(send, {'response': response})
+    elif path == '/chat/batch' and method == 'POST':
+        bot.start_reload()
+        try:
+            responses = batch_replies(_json(body), check=False)
+        except ValueError as e:
+            await _respond_json(send, {'error': str(e)}, 400)
+            return
+        await _respond_json(send, {'responses': responses})
+    elif path == '/cache/stats' and method == 'GET':
+        await _respond_json(send, bot.stats())
+    else:
+        status, headers, content = await asyncio.get_running_loop().run_in_executor(
+            None, _call_wsgi, scope, body)
+        await _respond(send, status, headers, content)
@@ -0,0 +1,382 @@
+"""Benchmarks for the admission chatbot.
+
+Usage:
+    python benchmark.py intent --messages 20000
+    python benchmark.py program --messages 20000 --catalog-sizes 5 50 500
+    python benchmark.py reload --messages 20000 --reloads 20 --catalog-sizes 5 500 5000
+    python benchmark.py responses --messages 20000 --cache-sizes 0 1024
+    python benchmark.py load http://127.0.0.1:5000 http://127.0.0.1:8000 --requests 2000 --concurrency 8
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import re
+import statistics
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+from chatbot import AdmissionChatbot, KnowledgeBase, ProgramIndex
+
+SAMPLE_MESSAGES = [
+    "Hello",
+    "hi there!",
+    "What programs do you offer?",
+    "What are the requirements for Computer Science?",
+    "When is the deadline for Engineering?",
+    "How much is tuition for Medicine?",
+    "Tell me about Business Administration",
+    "how long does the law degree take",
+    "I need help with my application",
+    "what's the last date to apply for computerscience",
+    "Can you guide me through the admission process for engineering and medicine?",
+    "fees",
+    "thanks, bye",
+]
+
+WORDS = ("the a for and to of my i is what when how much long can you do about please "
+         "hello hi hey programs course majors degree requirement eligibility qualifications need "
+         "deadline due date apply last tuition fee cost price duration years length help assist "
+         "guide offer whatever highway hiking helpful applying engineering medicine law").split()
+
+
+def corpus(n, seed=0):
+    """``n`` chat messages: the sample questions plus random word salads."""
+    rng = random.Random(seed)
+    messages = []
+    for i in range(n):
+        if i % 2 == 0:
+            messages.append(rng.choice(SAMPLE_MESSAGES))
+        else:
+            words = [rng.choice(WORDS) for _ in range(rng.randint(1, 30))]
+            messages.append(' '.join(w.capitalize() if rng.random() < 0.2 else w for w in words))
+    return messages
+
+
+def _detect_intent_loop(bot, message):
+    """Reference per-pattern implementation, kept to check detect_intent against."""
+    message_lower = message.lower()
+    for intent, patterns in bot.patterns.items():
+        for pattern in patterns:
+            if re.search(pattern, message_lower):
+                return intent
+    return "unknown"
+
+
+def bench_intent(n):
+    """Check detect_intent against the per-pattern loop and compare their speed."""
+    bot = AdmissionChatbot()
+    messages = corpus(n)
+
+    start = time.perf_counter()
+    expected = [_detect_intent_loop(bot, m) for m in messages]
+    loop_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = [bot.detect_intent(m) for m in messages]
+    combined_time = time.perf_counter() - start
+
+    mismatches = sum(a != e for a, e in zip(actual, expected))
+    print(f"loop     {loop_time:8.3f}s  {loop_time / n * 1e6:7.2f} us/message")
+    print(f"combined {combined_time:8.3f}s  {combined_time / n * 1e6:7.2f} us/message  "
+          f"x{loop_time / combined_time:.2f}")
+    print(f"{n} messages, {mismatches} differ")
+    if mismatches:
+        raise SystemExit(1)
+
+
+def _detect_program_loop(programs, message):
+    """Reference per-program implementation, kept to check detect_program against."""
+    message_lower = message.lower()
+    for program, info in programs.items():
+        for name in [program] + list(info.get("aliases", [])):
+            name = name.lower()
+            if name in message_lower or name.replace(" ", "") in message_lower:
+                return program
+    return None
+
+
+def catalog(n, seed=0):
+    """The chatbot's programs followed by ``n`` made-up ones, some with aliases."""
+    rng = random.Random(seed)
+    programs = dict(AdmissionChatbot().programs)
+    fields = ("applied", "marine", "data", "environmental", "digital", "sports", "public",
+              "financial", "molecular", "urban", "nuclear", "cognitive", "creative", "maritime")
+    subjects = ("physics", "biology", "design", "studies", "policy", "analytics", "chemistry",
+                "planning", "economics", "robotics", "linguistics", "history", "nursing", "arts")
+    while len(programs) < n:
+        name = f"{rng.choice(fields)} {rng.choice(subjects)} {len(programs)}"
+        info = {
+            "requirements": f"High school diploma. Minimum GPA: {rng.choice(('2.5', '2.8', '3.0', '3.2'))}",
+            "deadline": f"Fall: June {rng.randint(1, 30)}",
+            "duration": f"{rng.randint(3, 5)} years (Bachelor's)",
+            "tuition": f"${rng.randint(8, 25)},000 per year"
+        }
+        if rng.random() < 0.3:
+            info["aliases"] = [f"{name.split()[0][:3]}{name.split()[1][:3]} {len(programs)}"]
+        programs[name] = info
+    return programs
+
+
+def _program_messages(programs, n, rng):
+    names = list(programs)
+    return [m if rng.random() < 0.3 else f"{m} about {rng.choice(names)}" for m in corpus(n)]
+
+
+def bench_program(n, catalog_sizes):
+    """Check detect_program against the per-program loop for several catalog sizes.
+
+    Messages mention a random program of the catalog (or none), so the
+    loop has to walk half the catalog on average.
+    """
+    bot = AdmissionChatbot(check_interval=None)
+    rng = random.Random(0)
+    for size in catalog_sizes:
+        programs = catalog(size)
+        messages = _program_messages(programs, n, rng)
+
+        start = time.perf_counter()
+        index = ProgramIndex(programs)
+        build_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        expected = [_detect_program_loop(programs, m) for m in messages]
+        loop_time = time.perf_counter() - start
+
+        bot.kb = KnowledgeBase(programs, bot.patterns)
+        start = time.perf_counter()
+        actual = [bot.detect_program(m) for m in messages]
+        index_time = time.perf_counter() - start
+
+        mismatches = sum(a != e for a, e in zip(actual, expected))
+        print(f"{len(programs):>6} programs  build {build_time * 1000:7.2f}ms  "
+              f"loop {loop_time / n * 1e6:7.2f} us/message  index {index_time / n * 1e6:7.2f} us/message  "
+              f"x{loop_time / index_time:.2f}  {mismatches} differ")
+        if mismatches:
+            raise SystemExit(1)
+
+
+def _write_json(path, kb):
+    # Replace the file in one step, like a deploy would, so no reader sees half of it
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(kb, f)
+    os.replace(path + '.tmp', path)
+
+
+def _p50_p99(values, scale=1.0):
+    """The 50th and 99th percentiles of ``values``, multiplied by ``scale``."""
+    if len(values) < 2:
+        return values[0] * scale, values[0] * scale
+    cuts = statistics.quantiles(values, n=100, method='inclusive')
+    return cuts[49] * scale, cuts[98] * scale
+
+
+def bench_reload(n, reloads, catalog_sizes):
+    """Time knowledge base reloads, and answers before and while reloading.
+
+    For each catalog size a knowledge base file is written, then answers
+    are timed without checks of the file and with a check (a stat) on
+    every request. Reload latency covers noticing the change, reading,
+    hashing and rebuilding the indexes. Last, a thread keeps changing the
+    file and reloading while the main thread answers, to show that the
+    answers wait for no reload.
+    """
+    patterns = AdmissionChatbot(check_interval=None).patterns
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'knowledge_base.json')
+        for size in catalog_sizes:
+            kb = {'programs': catalog(size), 'patterns': patterns}
+            _write_json(path, kb)
+            bot = AdmissionChatbot(path, check_interval=None)
+            messages = _program_messages(kb['programs'], n, rng)
+
+            start = time.perf_counter()
+            for m in messages:
+                bot.get_response(m)
+            unchecked = (time.perf_counter() - start) / n
+
+            bot.check_interval = 0
+            start = time.perf_counter()
+            for m in messages:
+                bot.get_response(m)
+            checked = (time.perf_counter() - start) / n
+            bot.check_interval = None
+
+            law = kb['programs']['law']
+            latencies = []
+            for i in range(reloads):
+                law['tuition'] = f"${11000 + i + 1:,} per year"
+                _write_json(path, kb)
+                start = time.perf_counter()
+                if not bot.reload():
+                    raise SystemExit(f"Change {i + 1} was not reloaded: {bot.reload_error}")
+                latencies.append(time.perf_counter() - start)
+            if bot.get_response('law tuition') != f"**Law - Tuition:**\n{law['tuition']}":
+                raise SystemExit("The reloaded knowledge base is not the one answering")
+            reload_p50, _ = _p50_p99(latencies, 1000.0)
+
+            stop = threading.Event()
+            swaps = [0]
+
+            def reloader():
+                i = 0
+                while not stop.is_set():
+                    i += 1
+                    law['tuition'] = f"${i:,} per year"
+                    _write_json(path, kb)
+                    swaps[0] += bot.reload()
+
+            answers = []
+            thread = threading.Thread(target=reloader)
+            thread.start()
+            for m in messages:
+                t0 = time.perf_counter()
+                bot.get_response(m)
+                answers.append(time.perf_counter() - t0)
+            stop.set()
+            thread.join()
+            during_p50, during_p99 = _p50_p99(answers, 1e6)
+
+            print(f"{len(kb['programs']):>6} programs  reload p50 {reload_p50:8.2f}ms  "
+                  f"max {max(latencies) * 1000.0:8.2f}ms  |  answer {unchecked * 1e6:6.2f} us, "
+                  f"{checked * 1e6:6.2f} us with a stat per request  |  while reloading "
+                  f"p50 {during_p50:6.2f} us  p99 {during_p99:8.2f} us  "
+                  f"({swaps[0]} swaps)")
+
+
+def bench_responses(n, cache_sizes):
+    """Check get_response against composing every answer, and compare their speed.
+
+    Half of the messages are the sample questions, repeated, like most of
+    the traffic; the other half are random and rarely repeat.
+    """
+    messages = corpus(n)
+    kb = AdmissionChatbot(check_interval=None).kb
+
+    start = time.perf_counter()
+    expected = [kb.compose_response(kb.detect_intent(m), kb.detect_program(m)) for m in messages]
+    compose_time = time.perf_counter() - start
+    print(f"composed      {compose_time / n * 1e6:7.2f} us/message")
+
+    for size in cache_sizes:
+        bot = AdmissionChatbot(check_interval=None, cache_size=size)
+        start = time.perf_counter()
+        actual = [bot.get_response(m) for m in messages]
+        elapsed = time.perf_counter() - start
+        mismatches = sum(a != e for a, e in zip(actual, expected))
+        stats = bot.stats()
+        print(f"cache={size:<6} {elapsed / n * 1e6:7.2f} us/message  x{compose_time / elapsed:.2f}  "
+              f"hit rate {stats['hit_rate']:.2f}  {stats['responses']} responses  {mismatches} differ")
+        if mismatches:
+            raise SystemExit(1)
+
+    bot = AdmissionChatbot(check_interval=None)
+    bot.get_response(SAMPLE_MESSAGES[3])
+    start = time.perf_counter()
+    for _ in range(n):
+        bot.get_response(SAMPLE_MESSAGES[3])
+    print(f"repeated      {(time.perf_counter() - start) / n * 1e6:7.2f} us/message")
+
+
+def _load(url, path, payloads, concurrency):
+    """POST ``payloads`` to ``url + path`` from ``concurrency`` threads, one connection each."""
+    parts = urlsplit(url)
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def worker(share):
+        conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+        own = []
+        for payload in share:
+            body = json.dumps(payload).encode('utf-8')
+            t0 = time.perf_counter()
+            try:
+                conn.request('POST', parts.path.rstrip('/') + path, body, {'Content-Type': 'application/json'})
+                response = conn.getresponse()
+                response.read()
+                ok = response.status == 200
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                ok = False
+            own.append(time.perf_counter() - t0)
+            if not ok:
+                with lock:
+                    errors[0] += 1
+        conn.close()
+        with lock:
+            latencies.extend(own)
+
+    workers = [threading.Thread(target=worker, args=(payloads[i::concurrency],)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return latencies, time.perf_counter() - start, errors[0]
+
+
+def bench_load(urls, requests, concurrency, batch_size):
+    """Load-test running servers with /chat, one message per request, and /chat/batch.
+
+    Start the servers first, for example ``python app.py`` (port 5000) or
+    gunicorn for the WSGI mode and ``uvicorn asgi:app --port 8000`` for
+    the ASGI mode. Both endpoints get ``requests`` requests; each batch
+    holds ``batch_size`` messages.
+    """
+    messages = corpus(requests * batch_size)
+    for url in urls:
+        runs = [
+            ('/chat', [{'message': m} for m in messages[:requests]], 1),
+            ('/chat/batch', [{'messages': messages[i:i + batch_size]}
+                             for i in range(0, requests * batch_size, batch_size)], batch_size)
+        ]
+        for path, payloads, per_request in runs:
+            latencies, elapsed, errors = _load(url, path, payloads, concurrency)
+            p50, p99 = _p50_p99(latencies, 1000.0)
+            print(f"{url + path:<40} {len(latencies) / elapsed:8.1f} req/s  "
+                  f"{len(latencies) * per_request / elapsed:9.1f} msg/s  "
+                  f"p50 {p50:7.2f}ms  p99 {p99:7.2f}ms  {errors} errors")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('intent', help='check and time the combined intent regex')
+    p.add_argument('--messages', type=int, default=20000)
+
+    p = sub.add_parser('program', help='check and time the program name index')
+    p.add_argument('--messages', type=int, default=20000)
+    p.add_argument('--catalog-sizes', type=int, nargs='+', default=[5, 50, 500])
+
+    p = sub.add_parser('reload', help='time knowledge base reloads and answers around them')
+    p.add_argument('--messages', type=int, default=20000)
+    p.add_argument('--reloads', type=int, default=20)
+    p.add_argument('--catalog-sizes', type=int, nargs='+', default=[5, 500, 5000])
+
+    p = sub.add_parser('responses', help='check and time the response table and cache')
+    p.add_argument('--messages', type=int, default=20000)
+    p.add_argument('--cache-sizes', type=int, nargs='+', default=[0, 1024])
+
+    p = sub.add_parser('load', help='load-test running servers')
+    p.add_argument('urls', nargs='+')
+    p.add_argument('--requests', type=int, default=2000)
+    p.add_argument('--concurrency', type=int, default=8)
+    p.add_argument('--batch-size', type=int, default=10)
+
+    args = parser.parse_args()
+    if args.command == 'intent':
+        bench_intent(args.messages)
+    elif args.command == 'program':
+        bench_program(args.messages, args.catalog_sizes)
+    elif args.command == 'reload':
+        bench_reload(args.messages, args.reloads, args.catalog_sizes)
+    elif args.command == 'responses':
+        bench_responses(args.messages, args.cache_sizes)
+    elif args.command == 'load':
+        bench_load(args.urls, args.requests, args.concurrency, args.batch_size)
@@ -1,77 +1,196 @@
+import hashlib
+import json
+import os
 import re
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
 
-class AdmissionChatbot:
-    def __init__(self):
-        # Knowledge base
-        self.programs = {
-            "computer science": {
-                "requirements": "High school diploma with Mathematics and Physics. Minimum GPA: 3.0",
-                "deadline": "Fall: June 30, Spring: December 15",
-                "duration": "4 years (Bachelor's)",
-                "tuition": "$12,000 per year"
-            },
-            "business administration": {
-                "requirements": "High school diploma with Mathematics. Minimum GPA: 2.8",
-                "deadline": "Fall: July 15, Spring: January 10",
-                "duration": "4 years (Bachelor's)",
-                "tuition": "$10,000 per year"
-            },
-            "engineering": {
-                "requirements": "High school diploma with Mathematics, Physics, and Chemistry. Minimum GPA: 3.2",
-                "deadline": "Fall: June 15, Spring: December 1",
-                "duration": "4 years (Bachelor's)",
-                "tuition": "$15,000 per year"
-            },
-            "medicine": {
-                "requirements": "High school diploma with Biology, Chemistry, and Physics. Minimum GPA: 3.5",
-                "deadline": "Fall: May 31 (limited seats)",
-                "duration": "5 years (MBBS)",
-                "tuition": "$20,000 per year"
-            },
-            "law": {
-                "requirements": "High school diploma. Minimum GPA: 3.0",
-                "deadline": "Fall: July 1, Spring: December 20",
-                "duration": "4 years (LLB)",
-                "tuition": "$11,000 per year"
-            }
-        }
-        
-        # Patterns for intent recognition
-        self.patterns = {
-            "greeting": [r"\bhello\b", r"\bhi\b", r"\bhey\b", r"\bgreetings\b"],
-            "programs": [r"\bprograms?\b", r"\bcourses?\b", r"\bmajors?\b", r"\bdegrees?\b", r"\bwhat.*offer\b"],
-            "requirements": [r"\brequirements?\b", r"\beligibility\b", r"\bqualifications?\b", r"\bneed\b"],
-            "deadline": [r"\bdeadline\b", r"\bdue date\b", r"\bwhen.*apply\b", r"\blast date\b"],
-            "tuition": [r"\btuition\b", r"\bfees?\b", r"\bcost\b", r"\bprice\b", r"\bhow much\b"],
-            "duration": [r"\bduration\b", r"\bhow long\b", r"\byears?\b", r"\blength\b"],
-            "help": [r"\bhelp\b", r"\bassist\b", r"\bguide\b"]
-        }
-    
+DEFAULT_KNOWLEDGE_BASE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "knowledge_base.json")
+PROGRAM_FIELDS = ("requirements", "deadline", "duration", "tuition")
+
+
+def compile_intents(patterns):
+    """Combine the regex patterns of the intents into compiled regexes.
+
+    Each intent becomes a named group ``intent<i>`` inside a zero-width
+    lookahead, tried in the order of ``patterns``. Being zero-width, the
+    matches don't consume any text, so a long match of one intent can't
+    hide a match of another that starts inside it; at every position the
+    first intent in order wins. A leading ``\\b`` shared by all patterns is
+    hoisted out of the lookahead, so other positions are skipped quickly.
+
+    Returns one regex per priority: ``regexes[k]`` matches the first
+    ``k + 1`` intents only.
+    """
+    items = list(patterns.items())
+    hoist = all(p.startswith(r"\b") and "|" not in p for _, intent_patterns in items for p in intent_patterns)
+    alternatives = []
+    for i, (_, intent_patterns) in enumerate(items):
+        if hoist:
+            intent_patterns = [p[len(r"\b"):] for p in intent_patterns]
+        alternatives.append(f"(?P<intent{i}>{'|'.join(f'(?:{p})' for p in intent_patterns)})")
+    prefix = r"\b" if hoist else ""
+    return [re.compile(f"{prefix}(?=(?:{'|'.join(alternatives[:k])}))")
+            for k in range(1, len(alternatives) + 1)]
+
+
+class ProgramIndex:
+    """Aho-Corasick automaton over the program names of a knowledge base.
+
+    The keywords of a program are its name, its optional ``aliases``, and
+    the same with spaces removed. A text is scanned once, so the cost of
+    a lookup depends on the length of the text, not on the number of
+    programs. Like checking the programs one by one, ``find`` returns the
+    program that comes first in the catalog among those mentioned,
+    wherever it appears in the text.
+    """
+
+    def __init__(self, programs):
+        self.programs = list(programs)
+        none = len(self.programs)
+        # Trie: transitions and the first program ending at each state
+        goto = [{}]
+        first = [none]
+        for index, (program, info) in enumerate(programs.items()):
+            for name in [program] + list(info.get("aliases", [])):
+                for keyword in {name.lower(), name.lower().replace(" ", "")}:
+                    if not keyword:
+                        continue
+                    state = 0
+                    for ch in keyword:
+                        if ch not in goto[state]:
+                            goto.append({})
+                            first.append(none)
+                            goto[state][ch] = len(goto) - 1
+                        state = goto[state][ch]
+                    first[state] = min(first[state], index)
+
+        # Breadth-first: failure links, inherited matches, and complete
+        # transitions so a scan never has to follow failure links
+        fail = [0] * len(goto)
+        self._delta = [dict(goto[0])] + [None] * (len(goto) - 1)
+        queue = list(goto[0].values())
+        for state in queue:
+            delta = dict(self._delta[fail[state]])
+            for ch, child in goto[state].items():
+                fail[child] = self._delta[fail[state]].get(ch, 0)
+                queue.append(child)
+                delta[ch] = child
+            self._delta[state] = delta
+            first[state] = min(first[state], first[fail[state]])
+        self._first = first
+
+    def find(self, text):
+        """Return the first program in catalog order whose keywords occur in ``text``, or None."""
+        delta = self._delta
+        first = self._first
+        best = len(self.programs)
+        state = 0
+        for ch in text:
+            state = delta[state].get(ch, 0)
+            if first[state] < best:
+                best = first[state]
+                if best == 0:
+                    break
+        return self.programs[best] if best < len(self.programs) else None
+
+
+class KnowledgeBase:
+    """One version of the knowledge base, with the indexes built from it.
+
+    ``programs`` maps each program to its ``requirements``, ``deadline``,
+    ``duration``, ``tuition`` and optional ``aliases``; ``patterns`` maps
+    each intent to its regex patterns, in priority order. ``version`` is
+    the SHA-256 of the JSON it was read from (or of its content). A KnowledgeBase is never
+    changed after it is built, so it can be swapped for a new one while
+    other threads are still using it.
+    """
+
+    def __init__(self, programs, patterns, version=None):
+        self.validate(programs, patterns)
+        self.programs = programs
+        self.patterns = patterns
+        self.version = version or hashlib.sha256(
+            json.dumps([programs, patterns], sort_keys=True).encode("utf-8")).hexdigest()
+        self.intents = list(patterns)
+        self.intent_regexes = compile_intents(patterns)
+        self.program_index = ProgramIndex(programs)
+        # Every response, composed once; equal texts are stored once
+        texts = {}
+        self.responses = {}
+        for intent in self.intents + ["unknown"]:
+            for program in [None] + list(programs):
+                text = self.compose_response(intent, program)
+                self.responses[intent, program] = texts.setdefault(text, text)
+
+    @staticmethod
+    def validate(programs, patterns):
+        """Raise ValueError unless ``programs`` and ``patterns`` have the expected structure."""
+        if not isinstance(programs, dict) or not isinstance(patterns, dict) or not patterns:
+            raise ValueError("The knowledge base needs a 'programs' and a non-empty 'patterns' object")
+        for program, info in programs.items():
+            if not isinstance(info, dict):
+                raise ValueError(f"Program '{program}' must be an object")
+            missing = [field for field in PROGRAM_FIELDS if not isinstance(info.get(field), str)]
+            if missing:
+                raise ValueError(f"Program '{program}' has no {', '.join(missing)}")
+            aliases = info.get("aliases", [])
+            if not isinstance(aliases, list) or not all(isinstance(alias, str) for alias in aliases):
+                raise ValueError(f"The aliases of program '{program}' must be a list of strings")
+        for intent, intent_patterns in patterns.items():
+            # An intent without patterns would match every message
+            if not isinstance(intent_patterns, list) or not intent_patterns \
+                    or not all(isinstance(pattern, str) for pattern in intent_patterns):
+                raise ValueError(f"Intent '{intent}' needs a non-empty list of patterns")
+
+    @classmethod
+    def from_json(cls, data):
+        """Build a knowledge base from the bytes of a JSON document."""
+        kb = json.loads(data)
+        if not isinstance(kb, dict):
+            raise ValueError("The knowledge base must be a JSON object")
+        return cls(kb.get("programs"), kb.get("patterns"), version=hashlib.sha256(data).hexdigest())
+
+    @classmethod
+    def load(cls, path):
+        """Read a knowledge base from a JSON file."""
+        with open(path, "rb") as f:
+            return cls.from_json(f.read())
+
     def detect_intent(self, message):
-        """Detect user intent from message."""
+        """Detect user intent from message.
+
+        The matching intent that comes first in self.patterns wins. The
+        message is scanned once, front to back, with the combined intent
+        regex; after each match the scan only looks for intents that come
+        before the best one found so far.
+        """
         message_lower = message.lower()
         
-        for intent, patterns in self.patterns.items():
-            for pattern in patterns:
-                if re.search(pattern, message_lower):
-                    return intent
-        return "unknown"
+        regex = self.intent_regexes[-1]
+        pos = 0
+        best = None
+        while True:
+            match = regex.search(message_lower, pos)
+            if not match:
+                break
+            best = int(match.lastgroup[len("intent"):])
+            if best == 0:
+                break
+            regex = self.intent_regexes[best - 1]
+            pos = match.start() + 1
+        return self.intents[best] if best is not None else "unknown"
     
     def detect_program(self, message):
         """Detect which program the user is asking about."""
         message_lower = message.lower()
         
-        for program in self.programs.keys():
-            if program in message_lower or program.replace(" ", "") in message_lower:
-                return program
-        return None
-    
-    def get_response(self, message):
-        """Generate response based on user message."""
-        intent = self.detect_intent(message)
-        program = self.detect_program(message)
-        
+        return self.program_index.find(message_lower)
+
+    def compose_response(self, intent, program):
+        """Compose the response to a message of ``intent`` about ``program`` (None if none)."""
         # Greeting
         if intent == "greeting":
             return "Hello! Welcome to the University Admission Chatbot. 👋\n\nI can help you with:\n• Available programs\n• Admission requirements\n• Application deadlines\n• Tuition fees\n\nHow can I assist you today?"
@@ -121,3 +240,169 @@ class AdmissionChatbot:
                "• Application deadlines\n" \
                "• Tuition fees\n\n" \
                "Try asking 'What programs do you offer?' or type 'help' for more options."
+
+
+class ResponseCache:
+    """Bounded LRU of responses, keyed by knowledge base version and normalized message."""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max(0, int(max_entries))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return the response for ``key``, or None on a miss."""
+        with self._lock:
+            response = self._entries.get(key)
+            if response is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return response
+
+    def put(self, key, response):
+        with self._lock:
+            self._entries[key] = response
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+class AdmissionChatbot:
+    """Answers admission questions from a knowledge base file.
+
+    The file is checked at most every ``check_interval`` seconds (None
+    never checks). When its modification time or size changed, and then
+    its checksum, a new KnowledgeBase is built next to the current one
+    and swapped in with a single assignment: requests in flight finish
+    with the version they started with, and only the request that noticed
+    the change pays for the rebuild while the others go on with the old
+    version. A file that doesn't load leaves the current version in place
+    and its error in ``reload_error``.
+
+    Responses only depend on the intent and the program of a message, so
+    the knowledge base composes all of them when it loads, and the last
+    ``cache_size`` messages (lowercased and stripped) are remembered with
+    their response: a repeated question costs one cache lookup.
+    """
+
+    def __init__(self, path=DEFAULT_KNOWLEDGE_BASE, check_interval=1.0, cache_size=1024):
+        self.path = path
+        self.check_interval = check_interval
+        self.cache = ResponseCache(cache_size)
+        self.reload_error = None
+        self._reload_lock = threading.Lock()
+        self._stat = self._file_stat()
+        self.kb = KnowledgeBase.load(path)
+        self._next_check = time.monotonic() + (check_interval or 0)
+
+    @property
+    def programs(self):
+        return self.kb.programs
+
+    @property
+    def patterns(self):
+        return self.kb.patterns
+
+    def _file_stat(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def reload_due(self):
+        """Whether the next request will check the knowledge base file."""
+        return self.check_interval is not None and time.monotonic() >= self._next_check
+
+    def start_reload(self):
+        """If a check of the file is due, run it in a background thread.
+
+        The next check is pushed back right away, so the requests answered
+        meanwhile use the current version without checking the file
+        themselves, and nobody waits for the rebuild.
+        """
+        if not self.reload_due():
+            return
+        self._next_check = time.monotonic() + (self.check_interval or 0)
+        threading.Thread(target=self.reload, daemon=True).start()
+
+    def knowledge_base(self):
+        """Return the current KnowledgeBase, reloading it first if the file changed."""
+        if self.reload_due():
+            self.reload()
+        return self.kb
+
+    def reload(self):
+        """Swap in the knowledge base file if it changed; return True if it did."""
+        if not self._reload_lock.acquire(blocking=False):
+            # Another thread is reloading, keep answering with the current version
+            return False
+        try:
+            self._next_check = time.monotonic() + (self.check_interval or 0)
+            try:
+                stat = self._file_stat()
+                if stat == self._stat:
+                    return False
+                self._stat = stat
+                with open(self.path, "rb") as f:
+                    data = f.read()
+                if hashlib.sha256(data).hexdigest() == self.kb.version:
+                    return False
+                kb = KnowledgeBase.from_json(data)
+            except (OSError, ValueError, re.error) as e:
+                self.reload_error = str(e)
+                return False
+            self.kb = kb
+            # Answers of the old version can't be hit anymore, free them
+            self.cache.clear()
+            self.reload_error = None
+            return True
+        finally:
+            self._reload_lock.release()
+
+    def detect_intent(self, message):
+        """Detect user intent from message."""
+        return self.knowledge_base().detect_intent(message)
+    
+    def detect_program(self, message):
+        """Detect which program the user is asking about."""
+        return self.knowledge_base().detect_program(message)
+    
+    def get_response(self, message, check=True):
+        """Generate response based on user message.
+
+        With ``check=False`` the current knowledge base answers without
+        checking the file, for callers that use ``start_reload`` instead.
+        """
+        kb = self.knowledge_base() if check else self.kb
+        key = message.lower().strip()
+        response = self.cache.get((kb.version, key))
+        if response is None:
+            response = kb.responses[kb.detect_intent(key), kb.detect_program(key)]
+            self.cache.put((kb.version, key), response)
+        return response
+
+    def stats(self):
+        """Response cache statistics and the knowledge base in use."""
+        kb = self.kb
+        return dict(self.cache.stats(),
+                    responses=len(kb.responses),
+                    knowledge_base=kb.version,
+                    reload_error=self.reload_error)
+    
@@ -23,7 +23,7 @@ chatForm.addEventListener('submit', async (e) => {
     showTyping();
 
     try {
-        const response = await fetch('/chat', {
+        const response = await fetch('chat', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
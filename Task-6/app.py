@@ -1,24 +1,174 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response
+import base64
 import os
+import re
+import shutil
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 import cv2
 import numpy as np
 from werkzeug.utils import secure_filename
-from face_analyzer import FaceProfiler
+from face_analyzer import FaceProfiler, ProfilerPool, analyze_video
+from motion_counter import count_moving_objects
+from result_cache import ResultCache
 
 app = Flask(__name__)
 app.secret_key = "supersecretkey"
 app.config['UPLOAD_FOLDER'] = 'static/uploads'
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))  # 16MB max by default
+app.config['PROFILER_POOL_SIZE'] = int(os.environ.get('PROFILER_POOL_SIZE', 2))  # Requests analysed at once
+app.config['MAX_NUM_FACES'] = int(os.environ.get('MAX_NUM_FACES', 1))  # Faces analysed per image
+app.config['SAVE_UPLOADS'] = os.environ.get('SAVE_UPLOADS', '0') == '1'  # Keep uploaded images and results on disk
+app.config['UPLOAD_MAX_AGE'] = int(os.environ.get('UPLOAD_MAX_AGE', 3600))  # Seconds before generated files are deleted
+app.config['RESULT_CACHE_SIZE'] = int(os.environ.get('RESULT_CACHE_SIZE', 256))  # Analysed images kept in memory
+app.config['RESULT_CACHE_DIR'] = os.environ.get('RESULT_CACHE_DIR', '')  # Also keep them on disk here ('' = off)
+app.config['VIDEO_SAMPLE_EVERY'] = int(os.environ.get('VIDEO_SAMPLE_EVERY', 1))  # Profile faces on every N-th video frame
+app.config['VIDEO_WORKERS'] = int(os.environ.get('VIDEO_WORKERS', 2))  # Videos analysed at once
+app.config['MOTION_MAX_SIDE'] = int(os.environ.get('MOTION_MAX_SIDE', 640))  # Motion analysis resolution (0 = source)
+app.config['MOTION_FRAME_SKIP'] = int(os.environ.get('MOTION_FRAME_SKIP', 1))  # Analyse motion on every N-th frame
 
 # Ensure upload directory exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+# Build and warm up the MediaPipe graphs once, shared by all requests
+profilers = ProfilerPool(size=app.config['PROFILER_POOL_SIZE'], max_num_faces=app.config['MAX_NUM_FACES'])
+# Results by image content, so repeated photos skip the mesh
+result_cache = ResultCache(max_entries=app.config['RESULT_CACHE_SIZE'],
+                           disk_dir=app.config['RESULT_CACHE_DIR'] or None)
+# Worker threads for batch requests; each one borrows a profiler from the pool
+batch_executor = ThreadPoolExecutor(max_workers=app.config['PROFILER_POOL_SIZE'])
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in {'png', 'jpg', 'jpeg'}
 
 def allowed_video_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in {'mp4', 'avi', 'mov', 'mkv'}
 
+# Files the app writes to the upload folder: <id>_<name>, result_<id>_<name>, batch_<id>/
+GENERATED_UPLOAD = re.compile(r'^(result_|batch_)?([0-9a-f]{32})')
+cleanup_lock = threading.Lock()
+last_cleanup = 0.0
+
+def cleanup_uploads(max_age=None):
+    """Delete the files the app generated in the upload folder that are
+    older than ``max_age`` seconds (``UPLOAD_MAX_AGE`` by default), and
+    forget the video jobs that finished before then.
+
+    Uploads of videos that are still being analysed are kept.
+    """
+    max_age = app.config['UPLOAD_MAX_AGE'] if max_age is None else max_age
+    cutoff = time.time() - max_age
+    for name in os.listdir(app.config['UPLOAD_FOLDER']):
+        match = GENERATED_UPLOAD.match(name)
+        if not match:
+            continue
+        job = _video_job(match.group(2))
+        if job is not None and job['status'] in ('queued', 'running'):
+            continue
+        path = os.path.join(app.config['UPLOAD_FOLDER'], name)
+        try:
+            if os.path.getmtime(path) >= cutoff:
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+        except OSError:
+            pass
+    with video_jobs_lock:
+        for job_id in [job_id for job_id, job in video_jobs.items()
+                       if job.get('finished_at', cutoff) < cutoff]:
+            del video_jobs[job_id]
+
+def _maybe_cleanup():
+    # At most once a minute, from the requests that write files
+    global last_cleanup
+    with cleanup_lock:
+        if time.time() - last_cleanup < 60:
+            return
+        last_cleanup = time.time()
+    cleanup_uploads()
+
+def analyze_bytes(data, annotate=False):
+    """Decode and analyse an encoded image in memory.
+
+    Returns a dict with the ``landmarks``, ``face_rects`` and ``profiles``
+    of every face (left to right) and, with ``annotate``, the annotated
+    image encoded as JPEG under ``annotated``. Returns None if there is no
+    face, and raises ValueError if ``data`` is not an image.
+
+    Results are cached by the content of ``data``; a cached image is only
+    decoded again to draw an annotation that wasn't asked for before.
+    """
+    key = ResultCache.key_for(data, max_num_faces=app.config['MAX_NUM_FACES'])
+    result = result_cache.get(key)
+    image = None
+    changed = False
+
+    if result is None:
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError("Error loading image")
+
+        # Only the mesh needs a profiler to itself
+        with profilers.profiler() as profiler:
+            landmarks, face_rects = profiler.get_all_landmarks(image)
+        result = {
+            'landmarks': landmarks,
+            'face_rects': face_rects,
+            'profiles': profiler.analyze_faces(landmarks) if landmarks is not None else None,
+            'annotated': None
+        }
+        changed = True
+
+    if annotate and result['landmarks'] is not None and result['annotated'] is None:
+        if image is None:
+            image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        annotated = FaceProfiler.draw_analysis(image, result['landmarks'])
+        result = dict(result, annotated=cv2.imencode('.jpg', annotated)[1].tobytes())
+        changed = True
+
+    if changed:
+        result_cache.put(key, result)
+    return result if result['landmarks'] is not None else None
+
+def _faces_json(result):
+    """Public view of an analyze_bytes result; the first face is repeated at the top level."""
+    faces = [{'face_rect': rect, 'profile': profile}
+             for rect, profile in zip(result['face_rects'], result['profiles'])]
+    return {'face_rect': faces[0]['face_rect'], 'profile': faces[0]['profile'], 'faces': faces}
+
+def render_analysis(data, filename=None):
+    """Analyse an uploaded image and render the result page.
+
+    The annotated image is embedded in the page, unless ``filename`` names
+    the upload saved on disk, in which case the result is saved next to it.
+    """
+    try:
+        result = analyze_bytes(data, annotate=True)
+    except ValueError as e:
+        flash(str(e))
+        return redirect(url_for('index'))
+    if result is None:
+        flash("No face detected in the image! Please try another photo.")
+        return redirect(url_for('index'))
+
+    if filename:
+        result_filename = 'result_' + os.path.splitext(filename)[0] + '.jpg'
+        with open(os.path.join(app.config['UPLOAD_FOLDER'], result_filename), 'wb') as f:
+            f.write(result['annotated'])
+        result_src = url_for('static', filename='uploads/' + result_filename)
+    else:
+        result_src = 'data:image/jpeg;base64,' + base64.b64encode(result['annotated']).decode('ascii')
+
+    return render_template('result.html',
+                           result_src=result_src,
+                           profile=result['profiles'][0],
+                           profiles=result['profiles'])
+
 @app.route('/', methods=['GET', 'POST'])
 def index():
     if request.method == 'POST':
@@ -30,85 +180,190 @@ def index():
             flash('No selected file')
             return redirect(request.url)
         if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
-            return redirect(url_for('analyze', filename=filename))
+            # Analysed straight from memory, in this request
+            data = file.read()
+            filename = None
+            if app.config['SAVE_UPLOADS']:
+                _maybe_cleanup()
+                filename = f"{uuid.uuid4().hex}_{secure_filename(file.filename)}"
+                with open(os.path.join(app.config['UPLOAD_FOLDER'], filename), 'wb') as f:
+                    f.write(data)
+            try:
+                return render_analysis(data, filename)
+            except Exception as e:
+                flash(f"An error occurred: {str(e)}")
+                return redirect(url_for('index'))
     
     return render_template('index.html')
 
 @app.route('/analyze/<filename>')
 def analyze(filename):
+    """Analyse an image previously saved in the upload folder."""
     filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
     
     try:
-        profiler = FaceProfiler()
-        
-        # Read image
-        image = cv2.imread(filepath)
-        if image is None:
-            flash("Error loading image")
-            return redirect(url_for('index'))
-            
-        # Get landmarks
-        landmarks, face_rect = profiler.get_landmarks(image)
-        
-        if landmarks is None:
-            flash("No face detected in the image! Please try another photo.")
-            return redirect(url_for('index'))
-            
-        # Calculate metrics and profile
-        metrics = profiler.calculate_metrics(landmarks)
-        profile = profiler.analyze_personality(metrics)
-        
-        # Draw analysis on image
-        result_img = profiler.draw_analysis(image, landmarks)
-        result_filename = 'result_' + filename
-        result_path = os.path.join(app.config['UPLOAD_FOLDER'], result_filename)
-        cv2.imwrite(result_path, result_img)
-        
-        return render_template('result.html', 
-                             original=filename, 
-                             result=result_filename, 
-                             profile=profile)
-                             
-    except FileNotFoundError as e:
-        flash(str(e))
+        with open(filepath, 'rb') as f:
+            data = f.read()
+        return render_analysis(data, filename)
+    except FileNotFoundError:
+        flash("Error loading image")
         return redirect(url_for('index'))
     except Exception as e:
         flash(f"An error occurred: {str(e)}")
         return redirect(url_for('index'))
 
-import threading
+@app.route('/api/analyze', methods=['POST'])
+def api_analyze():
+    """Analyse one uploaded image in memory and return the result as JSON.
 
-# Helper function to count moving objects in a video using background subtraction
-def process_video(video_path):
-    """Return the total count of moving objects detected in the video.
-    Simple approach: use MOG2 background subtractor, find contours on each frame,
-    and count distinct moving blobs per frame. The sum across frames is returned.
+    The annotated image is included as base64 JPEG (``annotated_image``)
+    unless ``annotate=0``; with ``format=jpeg`` the response is the
+    annotated JPEG itself.
     """
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
-        raise FileNotFoundError(f"Unable to open video file: {video_path}")
-    fgbg = cv2.createBackgroundSubtractorMOG2(history=500, varThreshold=16, detectShadows=False)
-    total_count = 0
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        fgmask = fgbg.apply(frame)
-        # Remove noise
-        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
-        fgmask = cv2.morphologyEx(fgmask, cv2.MORPH_OPEN, kernel)
-        # Find contours of moving objects
-        contours, _ = cv2.findContours(fgmask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        # Count contours with a reasonable area to filter out specks
-        for cnt in contours:
-            area = cv2.contourArea(cnt)
-            if area > 500:  # heuristic threshold
-                total_count += 1
-    cap.release()
-    return total_count
+    file = request.files.get('file')
+    if file is None or file.filename == '':
+        return jsonify({'error': 'No file'}), 400
+    as_jpeg = request.values.get('format') == 'jpeg'
+    annotate = as_jpeg or request.values.get('annotate', '1') != '0'
+    try:
+        result = analyze_bytes(file.read(), annotate=annotate)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if result is None:
+        return jsonify({'error': 'No face detected'}), 422
+
+    if as_jpeg:
+        return Response(result['annotated'], mimetype='image/jpeg')
+    response = _faces_json(result)
+    if annotate:
+        response['annotated_image'] = base64.b64encode(result['annotated']).decode('ascii')
+    return jsonify(response)
+
+def analyze_image(name, data, annotate_path=None, inline=False):
+    """Analyse one encoded image for the batch endpoint.
+
+    Returns a JSON-ready dict with the ``faces`` found (face rectangle and
+    profile of each, left to right; the first one is repeated at the top
+    level), or with an ``error`` if the image can't be decoded or has no
+    face. The annotated JPEG is written to ``annotate_path`` when one is
+    given, or included as base64 with ``inline``.
+    """
+    try:
+        result = analyze_bytes(data, annotate=bool(annotate_path) or inline)
+    except ValueError as e:
+        return {'filename': name, 'error': str(e)}
+    if result is None:
+        return {'filename': name, 'error': 'No face detected'}
+
+    if annotate_path:
+        with open(annotate_path, 'wb') as f:
+            f.write(result['annotated'])
+    response = dict(_faces_json(result), filename=name)
+    if inline:
+        response['annotated_image'] = base64.b64encode(result['annotated']).decode('ascii')
+    return response
+
+@app.route('/batch', methods=['POST'])
+def batch():
+    """Analyse many images in one request and return a JSON array of profiles.
+
+    Images are sent as ``images`` files and/or ``archive`` zip files, and
+    are analysed in parallel by the profiler pool. With ``annotate=1`` the
+    annotated images are saved and linked from each result (until they
+    are cleaned up after ``UPLOAD_MAX_AGE``); with ``annotate=inline`` they
+    are included as base64 instead.
+
+    There is one result per uploaded image, in upload order; files that
+    are not images get an ``error`` entry.
+    """
+    uploads = []  # (name, function returning the encoded image, None if unsupported)
+    for file in request.files.getlist('images'):
+        if file and file.filename:
+            uploads.append((file.filename, file.read if allowed_file(file.filename) else None))
+    for file in request.files.getlist('archive'):
+        try:
+            archive = zipfile.ZipFile(file.stream)
+        except zipfile.BadZipFile:
+            return jsonify({'error': f'Not a zip file: {file.filename}'}), 400
+        for info in archive.infolist():
+            if not info.is_dir():
+                read = lambda archive=archive, info=info: archive.read(info)
+                uploads.append((info.filename, read if allowed_file(info.filename) else None))
+    if not uploads:
+        return jsonify({'error': 'No images'}), 400
+
+    annotate = request.values.get('annotate')
+    inline = annotate == 'inline'
+    annotate_dir = None
+    if annotate == '1':
+        _maybe_cleanup()
+        annotate_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'batch_' + uuid.uuid4().hex)
+        os.makedirs(annotate_dir)
+
+    def run(index, name, read):
+        if read is None:
+            return {'filename': name, 'error': 'Unsupported file type'}
+        annotate_path = None
+        if annotate_dir:
+            # Prefix with the index, as names may repeat across folders
+            stem = os.path.splitext(secure_filename(os.path.basename(name)))[0] or 'image'
+            annotate_path = os.path.join(annotate_dir, f"{index:05d}_{stem}.jpg")
+        try:
+            result = analyze_image(name, read(), annotate_path, inline)
+        except Exception as e:
+            result = {'filename': name, 'error': str(e)}
+        if annotate_path and 'error' not in result:
+            result['annotated'] = annotate_path
+        return result
+
+    results = list(batch_executor.map(lambda args: run(*args),
+                                      ((i, name, read) for i, (name, read) in enumerate(uploads))))
+
+    static_dir = os.path.dirname(app.config['UPLOAD_FOLDER'])
+    for result in results:
+        if 'annotated' in result:
+            filename = os.path.relpath(result.pop('annotated'), static_dir).replace(os.sep, '/')
+            result['annotated_url'] = url_for('static', filename=filename)
+    return jsonify(results)
+
+# Background video jobs: job ID -> state, so long uploads don't time out the request
+video_jobs = {}
+video_jobs_lock = threading.Lock()
+video_executor = ThreadPoolExecutor(max_workers=app.config['VIDEO_WORKERS'])
+
+def _update_video_job(job_id, **fields):
+    with video_jobs_lock:
+        video_jobs[job_id].update(fields)
+
+def run_video_job(job_id, filepath, analysis):
+    """Worker: analyse one uploaded video and record progress in ``video_jobs``."""
+    _update_video_job(job_id, status='running')
+
+    def progress(frames_done, total_frames):
+        _update_video_job(job_id, frames_processed=frames_done, total_frames=total_frames)
+
+    try:
+        if analysis == 'faces':
+            result = analyze_video(filepath,
+                                   sample_every=app.config['VIDEO_SAMPLE_EVERY'],
+                                   max_num_faces=app.config['MAX_NUM_FACES'],
+                                   progress=progress)
+        else:
+            result = count_moving_objects(filepath,
+                                          max_side=app.config['MOTION_MAX_SIDE'],
+                                          frame_skip=app.config['MOTION_FRAME_SKIP'],
+                                          progress=progress)
+    except Exception as e:
+        _update_video_job(job_id, status='failed', error=str(e), finished_at=time.time())
+        return
+    finally:
+        if not app.config['SAVE_UPLOADS']:
+            # Only the result is kept
+            try:
+                os.remove(filepath)
+            except OSError:
+                pass
+    _update_video_job(job_id, status='done', result=result, finished_at=time.time())
 
 @app.route('/video', methods=['GET', 'POST'])
 def video():
@@ -121,17 +376,61 @@ def video():
             flash('No selected video')
             return redirect(request.url)
         if file and allowed_video_file(file.filename):
+            _maybe_cleanup()
+            job_id = uuid.uuid4().hex
             filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{job_id}_{filename}")
             file.save(filepath)
-            try:
-                count = process_video(filepath)
-            except Exception as e:
-                flash(f"Error processing video: {str(e)}")
-                return redirect(url_for('index'))
-            return render_template('result_video.html', video=filename, count=count)
+            analysis = 'faces' if request.form.get('analysis') == 'faces' else 'motion'
+            with video_jobs_lock:
+                video_jobs[job_id] = {
+                    'id': job_id,
+                    'status': 'queued',
+                    'video': filename,
+                    'analysis': analysis,
+                    'frames_processed': 0,
+                    'total_frames': 0,
+                    'result': None,
+                    'error': None
+                }
+            video_executor.submit(run_video_job, job_id, filepath, analysis)
+            return redirect(url_for('video_result', job_id=job_id))
     # GET request – show a simple upload page or redirect to index
     return redirect(url_for('index'))
 
+def _video_job(job_id):
+    with video_jobs_lock:
+        job = video_jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+@app.route('/video/<job_id>')
+def video_result(job_id):
+    job = _video_job(job_id)
+    if job is None:
+        flash("Unknown video job")
+        return redirect(url_for('index'))
+    if job['status'] == 'failed':
+        flash(f"Error processing video: {job['error']}")
+        return redirect(url_for('index'))
+    if job['status'] != 'done':
+        # The page refreshes itself until the job is done
+        return render_template('video_status.html', job=job)
+
+    result = job['result']
+    if job['analysis'] == 'faces':
+        return render_template('result_video.html', video=job['video'], faces=result['faces'], stats=result)
+    return render_template('result_video.html', video=job['video'], count=result['objects'], stats=result)
+
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify(result_cache.stats())
+
+@app.route('/video/<job_id>/status')
+def video_status(job_id):
+    job = _video_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job)
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
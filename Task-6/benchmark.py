@@ -0,0 +1,186 @@
+"""Benchmarks for the face analysis.
+
+Usage:
+    python benchmark.py warm path/to/face.jpg --requests 20 --threads 1 4
+    python benchmark.py metrics --faces 10000
+    python benchmark.py video path/to/clip.mp4 --sample-every 1 2 4
+    python benchmark.py motion path/to/clip.mp4 --max-sides 0 640 320 --frame-skips 1 2 4
+"""
+import argparse
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from face_analyzer import FaceProfiler, ProfilerPool, analyze_video
+from motion_counter import count_moving_objects
+
+
+def _calculate_metrics_loop(landmarks):
+    """Reference per-pair implementation, kept to check calculate_metrics against."""
+    def dist(p1, p2):
+        return np.linalg.norm(p1 - p2)
+
+    face_width = dist(landmarks[0], landmarks[16])
+    mid_eyebrow = (landmarks[21] + landmarks[22]) / 2
+    face_height = dist(mid_eyebrow, landmarks[8])
+    return {
+        "face_ratio": face_height / face_width,
+        "eye_spacing_ratio": dist(landmarks[39], landmarks[42]) / face_width,
+        "nose_width_ratio": dist(landmarks[31], landmarks[35]) / face_width,
+        "lip_fullness_ratio": dist(landmarks[51], landmarks[57]) / face_height,
+        "jaw_width_ratio": dist(landmarks[4], landmarks[12]) / face_width
+    }
+
+
+def _analyze(profiler, image):
+    landmarks, _ = profiler.get_landmarks(image)
+    if landmarks is None:
+        return None
+    profile = profiler.analyze_personality(profiler.calculate_metrics(landmarks))
+    profiler.draw_analysis(image, landmarks)
+    return profile
+
+
+def _report(name, latencies, elapsed):
+    ms = np.array(latencies) * 1000.0
+    p50, p95 = np.percentile(ms, [50, 95])
+    print(f"{name:<18} first {ms[0]:8.1f}ms  mean {ms.mean():8.1f}ms  p50 {p50:8.1f}ms  "
+          f"p95 {p95:8.1f}ms  {len(ms) / elapsed:7.2f} req/s")
+
+
+def bench_warm(image_path, requests, thread_counts):
+    """Compare a new FaceProfiler per request with a warmed-up ProfilerPool.
+
+    Latency is measured per request, as the analyze route sees it: cold
+    requests include building the FaceMesh graph, warm requests include
+    waiting for a free profiler of the pool.
+    """
+    image = cv2.imread(image_path)
+    if image is None:
+        raise SystemExit(f"Unable to read image: {image_path}")
+
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(requests):
+        t0 = time.perf_counter()
+        profiler = FaceProfiler()
+        _analyze(profiler, image)
+        profiler.close()
+        latencies.append(time.perf_counter() - t0)
+    _report('cold', latencies, time.perf_counter() - start)
+
+    for threads in thread_counts:
+        t0 = time.perf_counter()
+        pool = ProfilerPool(size=threads)
+        print(f"pool of {threads} built and warmed up in {(time.perf_counter() - t0) * 1000.0:.1f}ms")
+
+        latencies = []
+        lock = threading.Lock()
+
+        def worker(n):
+            for _ in range(n):
+                t0 = time.perf_counter()
+                with pool.profiler() as profiler:
+                    _analyze(profiler, image)
+                with lock:
+                    latencies.append(time.perf_counter() - t0)
+
+        # Spread the requests over the threads
+        counts = [requests // threads + (i < requests % threads) for i in range(threads)]
+        workers = [threading.Thread(target=worker, args=(n,)) for n in counts]
+        start = time.perf_counter()
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        _report(f'warm, {threads} thread(s)', latencies, time.perf_counter() - start)
+        pool.close()
+
+
+def bench_metrics(faces, seed=0):
+    """Check calculate_metrics, per face and on a stack, against the per-pair loop."""
+    rng = np.random.default_rng(seed)
+    # Landmarks the way get_landmarks returns them: integer pixel coordinates
+    stack = rng.integers(0, 2000, size=(faces, 68, 2))
+    profiler = FaceProfiler.__new__(FaceProfiler)  # calculate_metrics needs no mesh
+
+    start = time.perf_counter()
+    expected = [_calculate_metrics_loop(landmarks) for landmarks in stack]
+    loop_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    single = [profiler.calculate_metrics(landmarks) for landmarks in stack]
+    single_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batched = profiler.calculate_metrics(stack)
+    batch_time = time.perf_counter() - start
+
+    def same(a, b):
+        return a == b or (np.isnan(a) and np.isnan(b))
+
+    mismatches = sum(not all(same(s[k], e[k]) and same(batched[k][i], e[k]) for k in e)
+                     for i, (s, e) in enumerate(zip(single, expected)))
+    print(f"loop       {loop_time:8.3f}s")
+    print(f"per face   {single_time:8.3f}s  x{loop_time / single_time:.1f}")
+    print(f"stacked    {batch_time:8.3f}s  x{loop_time / batch_time:.1f}")
+    print(f"{faces} faces, {mismatches} differ")
+    if mismatches:
+        raise SystemExit(1)
+
+
+def bench_video(video_path, sample_every, max_num_faces=1):
+    """Report video face analysis speed against real time for several sampling rates."""
+    for n in sample_every:
+        result = analyze_video(video_path, sample_every=n, max_num_faces=max_num_faces)
+        realtime = result['realtime_factor']
+        mbtis = ' '.join(face['profile']['mbti'] for face in result['faces']) or '-'
+        print(f"sample_every={n:<3} {result['processing_fps']:8.2f} fps  "
+              f"x{realtime if realtime is not None else 0:.2f} real time  "
+              f"{len(result['faces'])} face(s): {mbtis}")
+
+
+def bench_motion(video_path, max_sides, frame_skips):
+    """Report motion counting speed and object count per resolution and frame skip."""
+    for max_side in max_sides:
+        for skip in frame_skips:
+            result = count_moving_objects(video_path, max_side=max_side, frame_skip=skip)
+            name = 'source' if not max_side else f'max_side={max_side}'
+            realtime = result['processing_fps'] / result['video_fps'] if result['video_fps'] else 0.0
+            print(f"{name:<14} skip={skip:<3} {result['processing_fps']:8.2f} fps  x{realtime:.2f} real time  "
+                  f"{result['objects']} objects ({result['detections']} blob detections)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('warm', help='compare cold and pooled profilers')
+    p.add_argument('image')
+    p.add_argument('--requests', type=int, default=20)
+    p.add_argument('--threads', type=int, nargs='+', default=[1, 4])
+
+    p = sub.add_parser('metrics', help='check and time the batched metrics')
+    p.add_argument('--faces', type=int, default=10000)
+
+    p = sub.add_parser('video', help='time video face analysis')
+    p.add_argument('video')
+    p.add_argument('--sample-every', type=int, nargs='+', default=[1, 2, 4])
+    p.add_argument('--max-faces', type=int, default=1)
+
+    p = sub.add_parser('motion', help='time the moving-object counter')
+    p.add_argument('video')
+    p.add_argument('--max-sides', type=int, nargs='+', default=[0, 640, 320])
+    p.add_argument('--frame-skips', type=int, nargs='+', default=[1, 2, 4])
+
+    args = parser.parse_args()
+    if args.command == 'warm':
+        bench_warm(args.image, args.requests, args.threads)
+    elif args.command == 'metrics':
+        bench_metrics(args.faces)
+    elif args.command == 'video':
+        bench_video(args.video, args.sample_every, args.max_faces)
+    elif args.command == 'motion':
+        bench_motion(args.video, args.max_sides, args.frame_skips)
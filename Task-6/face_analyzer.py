@@ -1,40 +1,71 @@
+import queue
+import time
+from collections import Counter
+from contextlib import contextmanager
+
 import cv2
 import mediapipe as mp
 import numpy as np
 
+from tracking import CentroidTracker
+
+# MediaPipe landmark indices that correspond to dlib 68 landmarks
+# (entry i is the MediaPipe index of dlib landmark i)
+LANDMARK_INDICES = np.array([
+    # Jawline (0-16)
+    234, 227, 137, 177, 215, 135, 169, 170, 152,
+    399, 396, 364, 435, 401, 366, 447, 454,
+    # Eyebrows (17-26)
+    70, 63, 105, 66, 107,
+    336, 296, 334, 293, 300,
+    # Nose (27-35)
+    168, 6, 197, 195, 5,
+    4, 19, 94, 2,
+    # Eyes (36-47)
+    33, 160, 158, 133, 153, 144,
+    362, 385, 387, 263, 373, 380,
+    # Mouth (48-67)
+    61, 39, 37, 0, 267, 269, 291,
+    375, 321, 405, 314, 17, 84, 181,
+    91, 146, 78, 191, 80, 81
+])
+
+# Landmark pairs measured by calculate_metrics, in this order:
+# face width, left eye, right eye, nose width, mouth height, eye spacing, jaw width
+METRIC_PAIRS = np.array([(0, 16), (36, 39), (42, 45), (31, 35), (51, 57), (39, 42), (4, 12)])
+
 class FaceProfiler:
-    def __init__(self, model_path=None):
+    def __init__(self, model_path=None, max_num_faces=1, static_image_mode=True):
         # MediaPipe doesn't need external model files
+        # (static_image_mode=False tracks faces across consecutive video frames)
         self.mp_face_mesh = mp.solutions.face_mesh
         self.face_mesh = self.mp_face_mesh.FaceMesh(
-            static_image_mode=True,
-            max_num_faces=1,
+            static_image_mode=static_image_mode,
+            max_num_faces=max_num_faces,
             refine_landmarks=True,
             min_detection_confidence=0.5
         )
-        
-        # MediaPipe landmark indices that correspond to dlib 68 landmarks
-        # This mapping converts MediaPipe's 468 landmarks to dlib-like 68 landmarks
-        self.landmark_mapping = {
-            # Jawline (0-16)
-            0: 234, 1: 227, 2: 137, 3: 177, 4: 215, 5: 135, 6: 169, 7: 170, 8: 152,
-            9: 399, 10: 396, 11: 364, 12: 435, 13: 401, 14: 366, 15: 447, 16: 454,
-            # Eyebrows (17-26)
-            17: 70, 18: 63, 19: 105, 20: 66, 21: 107,
-            22: 336, 23: 296, 24: 334, 25: 293, 26: 300,
-            # Nose (27-35)
-            27: 168, 28: 6, 29: 197, 30: 195, 31: 5,
-            32: 4, 33: 19, 34: 94, 35: 2,
-            # Eyes (36-47)
-            36: 33, 37: 160, 38: 158, 39: 133, 40: 153, 41: 144,
-            42: 362, 43: 385, 44: 387, 45: 263, 46: 373, 47: 380,
-            # Mouth (48-67)
-            48: 61, 49: 39, 50: 37, 51: 0, 52: 267, 53: 269, 54: 291,
-            55: 375, 56: 321, 57: 405, 58: 314, 59: 17, 60: 84, 61: 181,
-            62: 91, 63: 146, 64: 78, 65: 191, 66: 80, 67: 81
-        }
+
+    def warm_up(self, size=256):
+        """Run the mesh once on a blank image, so the first real request
+        doesn't pay for initialising the graph."""
+        self.face_mesh.process(np.zeros((size, size, 3), dtype=np.uint8))
+
+    def close(self):
+        self.face_mesh.close()
 
     def get_landmarks(self, image):
+        coords, face_rects = self.get_all_landmarks(image)
+        if coords is None:
+            return None, None
+        
+        # Get the first face
+        return coords[0], face_rects[0]
+
+    def get_all_landmarks(self, image):
+        """Landmarks of every detected face (up to ``max_num_faces``) from a
+        single mesh pass, as an Nx68x2 array plus the N face rectangles,
+        ordered left to right. Returns (None, None) if there is no face."""
         # Convert BGR to RGB
         rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
         results = self.face_mesh.process(rgb_image)
@@ -42,61 +73,54 @@ class FaceProfiler:
         if not results.multi_face_landmarks:
             return None, None
         
-        # Get the first face
-        face_landmarks = results.multi_face_landmarks[0]
-        
         # Convert MediaPipe landmarks to dlib-like 68 landmarks format
         h, w = image.shape[:2]
-        coords = np.zeros((68, 2), dtype=int)
-        
-        for i in range(68):
-            mp_idx = self.landmark_mapping[i]
-            landmark = face_landmarks.landmark[mp_idx]
-            coords[i] = (int(landmark.x * w), int(landmark.y * h))
+        indices = LANDMARK_INDICES.tolist()
+        points = np.array([[(mesh[i].x, mesh[i].y) for i in indices]
+                           for mesh in (face.landmark for face in results.multi_face_landmarks)])
+        # Scale to pixels and truncate towards zero, like int()
+        coords = (points * (w, h)).astype(int)
+        coords = coords[np.argsort(coords[:, :, 0].min(axis=1), kind='stable')]
         
         # Create a fake face rectangle for compatibility
-        x_coords = coords[:, 0]
-        y_coords = coords[:, 1]
-        face_rect = {
-            'left': int(np.min(x_coords)),
-            'top': int(np.min(y_coords)),
-            'right': int(np.max(x_coords)),
-            'bottom': int(np.max(y_coords))
-        }
+        mins, maxs = coords.min(axis=1), coords.max(axis=1)
+        face_rects = [{
+            'left': int(left),
+            'top': int(top),
+            'right': int(right),
+            'bottom': int(bottom)
+        } for (left, top), (right, bottom) in zip(mins, maxs)]
         
-        return coords, face_rect
+        return coords, face_rects
 
     def calculate_metrics(self, landmarks):
-        
+        """Facial ratios of one face (68x2 landmarks) or of a stack of faces
+        (Nx68x2), in which case every metric is an array of N values."""
+        landmarks = np.asarray(landmarks)
+
         def dist(p1, p2):
-            return np.linalg.norm(p1 - p2)
+            return np.sqrt(np.sum(np.square(p1 - p2), axis=-1))
 
-        # 1. Face Width (Jawline width)
-        face_width = dist(landmarks[0], landmarks[16])
+        # Distances of all METRIC_PAIRS at once, one column per pair
+        pairs = dist(landmarks[..., METRIC_PAIRS[:, 0], :], landmarks[..., METRIC_PAIRS[:, 1], :])
+        # 1. Face Width (Jawline width), 3. Eye Size, 4. Nose Width, 5. Lip Fullness (Height of mouth)
+        face_width, left_eye_width, right_eye_width, nose_width, mouth_height, eye_gap, jaw_width = \
+            np.moveaxis(pairs, -1, 0)
         
         # 2. Face Height (Chin to mid-eyebrow)
-        mid_eyebrow = (landmarks[21] + landmarks[22]) / 2
-        chin = landmarks[8]
+        mid_eyebrow = (landmarks[..., 21, :] + landmarks[..., 22, :]) / 2
+        chin = landmarks[..., 8, :]
         face_height = dist(mid_eyebrow, chin)
         
-        # 3. Eye Size (Average width of eyes)
-        left_eye_width = dist(landmarks[36], landmarks[39])
-        right_eye_width = dist(landmarks[42], landmarks[45])
         avg_eye_width = (left_eye_width + right_eye_width) / 2
         
-        # 4. Nose Width
-        nose_width = dist(landmarks[31], landmarks[35])
-        
-        # 5. Lip Fullness (Height of mouth)
-        mouth_height = dist(landmarks[51], landmarks[57])
-        
         # Ratios (normalized by face width/height to be scale invariant)
         metrics = {
             "face_ratio": face_height / face_width, # > 1.3 oblong, < 1.3 round/square
-            "eye_spacing_ratio": dist(landmarks[39], landmarks[42]) / face_width,
+            "eye_spacing_ratio": eye_gap / face_width,
             "nose_width_ratio": nose_width / face_width,
             "lip_fullness_ratio": mouth_height / face_height,
-            "jaw_width_ratio": dist(landmarks[4], landmarks[12]) / face_width # Lower jaw width
+            "jaw_width_ratio": jaw_width / face_width # Lower jaw width
         }
         
         return metrics
@@ -159,8 +183,30 @@ class FaceProfiler:
             "metrics": metrics
         }
 
-    def draw_analysis(self, image, landmarks):
+    def analyze_faces(self, landmarks):
+        """Profiles of a stack of faces (Nx68x2), with the metrics of all
+        faces computed in one batch."""
+        metrics = self.calculate_metrics(landmarks)
+        return [self.analyze_personality({name: values[i] for name, values in metrics.items()})
+                for i in range(len(landmarks))]
+
+    @staticmethod
+    def draw_analysis(image, landmarks):
+        """Draw one face (68x2 landmarks) or several (Nx68x2) on a copy of
+        ``image``. Several faces are numbered in order. Needs no mesh, so
+        it can also be called on the class."""
         img_copy = image.copy()
+        faces = np.asarray(landmarks).reshape(-1, 68, 2)
+        for number, face in enumerate(faces, 1):
+            FaceProfiler._draw_face(img_copy, face)
+            if len(faces) > 1:
+                left, top = face.min(axis=0)
+                cv2.putText(img_copy, str(number), (int(left), max(int(top) - 10, 20)),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+        return img_copy
+
+    @staticmethod
+    def _draw_face(img_copy, landmarks):
         # Draw jaw
         for i in range(0, 16):
             cv2.line(img_copy, tuple(landmarks[i]), tuple(landmarks[i+1]), (0, 255, 0), 2)
@@ -185,5 +231,138 @@ class FaceProfiler:
         for i in range(48, 59):
             cv2.line(img_copy, tuple(landmarks[i]), tuple(landmarks[i+1]), (0, 255, 0), 2)
         cv2.line(img_copy, tuple(landmarks[59]), tuple(landmarks[48]), (0, 255, 0), 2)
-        
-        return img_copy
+
+
+class ProfilerPool:
+    """A fixed set of FaceProfilers shared by concurrent requests.
+
+    Building a FaceMesh graph is what makes a new FaceProfiler slow, and a
+    graph must not be used by two threads at once. The pool builds ``size``
+    profilers up front (warmed up unless ``warm_up`` is False) and lends
+    each one to a single request at a time; further requests wait for one
+    to be returned.
+    """
+
+    def __init__(self, size=2, warm_up=True, **kwargs):
+        # kwargs are passed on to FaceProfiler, e.g. max_num_faces
+        self.size = max(1, int(size))
+        self._idle = queue.Queue()
+        for _ in range(self.size):
+            profiler = FaceProfiler(**kwargs)
+            if warm_up:
+                profiler.warm_up()
+            self._idle.put(profiler)
+
+    @contextmanager
+    def profiler(self, timeout=None):
+        """Borrow a profiler for the duration of a ``with`` block."""
+        profiler = self._idle.get(timeout=timeout)
+        try:
+            yield profiler
+        finally:
+            self._idle.put(profiler)
+
+    def close(self):
+        for _ in range(self.size):
+            self._idle.get().close()
+
+
+def analyze_video(video_path, sample_every=1, max_num_faces=1, max_missed=15, min_frames=3,
+                  progress=None):
+    """Profile the faces in a video with a tracking-mode FaceMesh.
+
+    Every ``sample_every``-th frame goes through the mesh; the frames in
+    between are skipped without being converted. Faces are followed from
+    frame to frame by a ``CentroidTracker``, which matches a face to the
+    nearest track within half its width (a face unseen for more than
+    ``max_missed`` sampled frames is dropped), and each face's metrics are
+    averaged over all frames it was seen in, so its profile describes the
+    whole clip rather than a single expression. Faces seen in fewer than
+    ``min_frames`` sampled frames are left out.
+
+    ``progress``, if given, is called as ``progress(frames_done, total_frames)``
+    every second or so.
+
+    Returns a dict with the ``faces`` (left to right at first sight) and
+    the frame counts and processing speed.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise FileNotFoundError(f"Unable to open video file: {video_path}")
+    video_fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+    total_frames = max(0, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+    sample_every = max(1, int(sample_every))
+    profiler = FaceProfiler(max_num_faces=max_num_faces, static_image_mode=False)
+
+    tracker = CentroidTracker(max_missed=max_missed)
+    tracks = []
+    start = time.perf_counter()
+    last_report = start
+    frame_index = sampled = 0
+    try:
+        while True:
+            if frame_index % sample_every:
+                if not cap.grab():
+                    break
+                frame_index += 1
+                continue
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frame_index += 1
+            sampled += 1
+            if progress and time.perf_counter() - last_report >= 1.0:
+                last_report = time.perf_counter()
+                progress(frame_index, total_frames)
+
+            landmarks, _ = profiler.get_all_landmarks(frame)
+            if landmarks is None:
+                # Still a frame the faces were missed in
+                tracker.update([])
+                continue
+            metrics = profiler.calculate_metrics(landmarks)
+            names = list(metrics)
+            values = np.column_stack([metrics[name] for name in names])
+            widths = np.ptp(landmarks[:, :, 0], axis=1)
+
+            assigned = tracker.update(landmarks.mean(axis=1), max_distances=widths / 2)
+            for fi, track in enumerate(assigned):
+                if track['frames'] == 1:
+                    track.update(id=len(tracks) + 1, first_frame=frame_index - 1,
+                                 sums=np.zeros(len(names)), mbti=Counter())
+                    tracks.append(track)
+                track['last_frame'] = frame_index - 1
+                track['sums'] += values[fi]
+                track['mbti'][profiler.analyze_personality(dict(zip(names, values[fi])))['mbti']] += 1
+    finally:
+        cap.release()
+        profiler.close()
+    elapsed = time.perf_counter() - start
+    if progress:
+        progress(frame_index, max(total_frames, frame_index))
+
+    faces = []
+    for track in tracks:
+        if track['frames'] < min_frames:
+            continue
+        averaged = {name: float(total / track['frames']) for name, total in zip(names, track['sums'])}
+        profile = profiler.analyze_personality(averaged)
+        faces.append({
+            'id': len(faces) + 1,
+            'first_frame': track['first_frame'],
+            'last_frame': track['last_frame'],
+            'frames': track['frames'],
+            'profile': profile,
+            # Share of frames whose own estimate agrees with the averaged one
+            'mbti_agreement': track['mbti'][profile['mbti']] / track['frames']
+        })
+
+    processing_fps = frame_index / elapsed if elapsed > 0 else 0.0
+    return {
+        'faces': faces,
+        'total_frames': frame_index,
+        'sampled_frames': sampled,
+        'video_fps': video_fps,
+        'processing_fps': round(processing_fps, 2),
+        'realtime_factor': round(processing_fps / video_fps, 2) if video_fps else None
+    }
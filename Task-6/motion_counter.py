@@ -0,0 +1,101 @@
+import time
+
+import cv2
+
+from tracking import CentroidTracker
+
+
+def count_moving_objects(video_path, max_side=640, frame_skip=1, min_area=500,
+                         max_distance=0.05, progress=None):
+    """Count the distinct moving objects in a video.
+
+    Moving blobs are found with a MOG2 background subtractor and followed
+    across frames by a ``CentroidTracker``, so an object is counted once
+    however long it stays in view.
+
+    ``max_side`` analyses frames scaled down so their longer side is at
+    most that many pixels (0 keeps the source size); ``min_area`` is given
+    in source pixels and scaled along. Only every ``frame_skip``-th frame
+    is analysed, the others are skipped without being converted.
+    ``max_distance`` is how far a blob may move between two analysed
+    frames, as a fraction of the longer side per skipped frame.
+
+    ``progress``, if given, is called as ``progress(frames_done, total_frames)``
+    every second or so.
+
+    Returns a dict with the ``objects`` count, the per-frame blob total
+    (``detections``), the frame counts and the processing fps.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise FileNotFoundError(f"Unable to open video file: {video_path}")
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    total_frames = max(0, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+    video_fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+
+    # Invariant setup, done once
+    scale = 1.0
+    if max_side and max(width, height) > max_side:
+        scale = max_side / max(width, height)
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    frame_skip = max(1, int(frame_skip))
+    min_area = min_area * scale * scale
+    fgbg = cv2.createBackgroundSubtractorMOG2(history=500, varThreshold=16, detectShadows=False)
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+    tracker = CentroidTracker(max_distance=min(0.25, max_distance * frame_skip) * max(size))
+
+    start = time.perf_counter()
+    last_report = start
+    frame_index = analysed = detections = 0
+    try:
+        while True:
+            if frame_index % frame_skip:
+                if not cap.grab():
+                    break
+                frame_index += 1
+                continue
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frame_index += 1
+            analysed += 1
+
+            if scale != 1.0:
+                frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+            fgmask = fgbg.apply(frame)
+            # Remove noise
+            fgmask = cv2.morphologyEx(fgmask, cv2.MORPH_OPEN, kernel)
+            # Find contours of moving objects
+            contours, _ = cv2.findContours(fgmask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            centroids = []
+            for cnt in contours:
+                # Keep contours with a reasonable area to filter out specks
+                if cv2.contourArea(cnt) > min_area:
+                    x, y, w, h = cv2.boundingRect(cnt)
+                    centroids.append((x + w / 2, y + h / 2))
+            detections += len(centroids)
+            tracker.update(centroids)
+
+            if progress and time.perf_counter() - last_report >= 1.0:
+                last_report = time.perf_counter()
+                progress(frame_index, total_frames)
+    finally:
+        cap.release()
+    elapsed = time.perf_counter() - start
+    if progress:
+        progress(frame_index, max(total_frames, frame_index))
+
+    return {
+        'objects': tracker.count,
+        'detections': detections,
+        'total_frames': frame_index,
+        'analysed_frames': analysed,
+        'width': width,
+        'height': height,
+        'analysis_width': size[0],
+        'analysis_height': size[1],
+        'video_fps': video_fps,
+        'processing_fps': round(frame_index / elapsed, 2) if elapsed > 0 else 0.0,
+        'seconds': round(elapsed, 3)
+    }
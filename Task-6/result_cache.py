@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class ResultCache:
+    """Face analysis results keyed by the content of the image.
+
+    The key is the SHA-256 of the encoded image plus the analysis
+    parameters, so the same photo uploaded under another name is a hit,
+    and a different parameter set is not. An entry holds the ``landmarks``
+    (None if the image has no face), ``face_rects``, ``profiles`` and the
+    ``annotated`` JPEG (None until an annotated result was asked for).
+
+    The ``max_entries`` most recently used entries are kept in memory.
+    With ``disk_dir``, entries are also written there as ``<key>.json`` /
+    ``<key>.jpg`` and survive restarts; the oldest files are deleted past
+    ``max_disk_entries``. Hits and misses of both tiers are counted.
+    """
+
+    def __init__(self, max_entries=256, disk_dir=None, max_disk_entries=10000):
+        self.max_entries = max(0, int(max_entries))
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._disk_entries = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._disk_entries = sum(name.endswith('.json') for name in os.listdir(disk_dir))
+
+    @staticmethod
+    def key_for(data, **params):
+        """Hash the encoded image and the analysis parameters into a cache key."""
+        h = hashlib.sha256(data)
+        h.update(json.dumps(params, sort_keys=True).encode('utf-8'))
+        return h.hexdigest()
+
+    def get(self, key):
+        """Return the entry for ``key``, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+        entry = self._load(key) if self.disk_dir else None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        self._remember(key, entry)
+        return entry
+
+    def put(self, key, entry):
+        """Store ``entry`` under ``key``, replacing an older one."""
+        self._remember(key, entry)
+        if self.disk_dir:
+            try:
+                self._save(key, entry)
+            except OSError:
+                # The disk tier is a best effort, the entry is still in memory
+                pass
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0
+            }
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _paths(self, key):
+        return os.path.join(self.disk_dir, key + '.json'), os.path.join(self.disk_dir, key + '.jpg')
+
+    def _load(self, key):
+        json_path, jpg_path = self._paths(key)
+        try:
+            with open(json_path) as f:
+                stored = json.load(f)
+            annotated = None
+            if stored.pop('annotated', False):
+                with open(jpg_path, 'rb') as f:
+                    annotated = f.read()
+            # Mark as recently used for eviction
+            os.utime(json_path)
+        except (OSError, ValueError):
+            return None
+        landmarks = stored['landmarks']
+        return dict(stored,
+                    landmarks=np.array(landmarks, dtype=int) if landmarks is not None else None,
+                    annotated=annotated)
+
+    def _write(self, path, data):
+        # A temporary file of its own, so requests storing the same key don't collide
+        fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def _save(self, key, entry):
+        json_path, jpg_path = self._paths(key)
+        landmarks = entry['landmarks']
+        stored = dict(entry,
+                      landmarks=landmarks.tolist() if landmarks is not None else None,
+                      annotated=entry['annotated'] is not None)
+        new = not os.path.exists(json_path)
+        # Image first, so a readable .json always has its .jpg
+        if entry['annotated'] is not None:
+            self._write(jpg_path, entry['annotated'])
+        self._write(json_path, json.dumps(stored).encode('utf-8'))
+        with self._lock:
+            if new:
+                self._disk_entries += 1
+            evict = self._disk_entries > self.max_disk_entries
+        if evict:
+            self._evict_disk()
+
+    def _evict_disk(self):
+        """Delete the least recently used files past ``max_disk_entries``."""
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if name.endswith('.json'):
+                try:
+                    entries.append((os.path.getmtime(os.path.join(self.disk_dir, name)), name[:-len('.json')]))
+                except OSError:
+                    continue
+        for _, key in sorted(entries)[:max(0, len(entries) - self.max_disk_entries)]:
+            for path in self._paths(key):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        with self._lock:
+            self._disk_entries = min(len(entries), self.max_disk_entries)
@@ -0,0 +1,72 @@
+import numpy as np
+
+
+class CentroidTracker:
+    """Follows objects (moving blobs, faces) across frames by their centroids.
+
+    Each centroid is matched greedily to the nearest active track within
+    ``max_distance`` pixels, or within its own limit if ``update`` is given
+    one per centroid; unmatched centroids start new tracks, and tracks
+    unseen for more than ``max_missed`` frames are dropped. A track counts
+    as an object once it has been seen in ``min_frames`` frames, which
+    keeps flicker out of the count.
+
+    Tracks are dicts with the ``centroid``, ``frames`` seen and frames
+    ``missed``; callers may keep their own fields in them.
+    """
+
+    def __init__(self, max_distance=np.inf, max_missed=10, min_frames=3):
+        self.max_distance = max_distance
+        self.max_missed = max_missed
+        self.min_frames = min_frames
+        self.active = []
+        self.count = 0
+
+    def update(self, centroids, max_distances=None):
+        """Associate this frame's centroids with tracks.
+
+        ``max_distances`` optionally gives each centroid its own distance
+        limit. Returns the track of every centroid, in order.
+        """
+        centroids = np.asarray(centroids, dtype=np.float64).reshape(-1, 2)
+        assigned = [None] * len(centroids)
+        matched = set()
+        uniform = max_distances is None
+        limits = np.full(len(centroids), self.max_distance) if uniform else np.asarray(max_distances)
+
+        if self.active and len(centroids):
+            distance = np.linalg.norm(
+                np.array([t['centroid'] for t in self.active])[:, None] - centroids[None], axis=-1)
+            # Greedy: closest pairs first
+            for flat in np.argsort(distance, axis=None):
+                ti, ci = (int(i) for i in np.unravel_index(flat, distance.shape))
+                if distance[ti, ci] > limits[ci]:
+                    if uniform:
+                        # Sorted by distance, so no later pair is close enough
+                        break
+                    # Another centroid's limit may still be wide enough
+                    continue
+                if ti in matched or assigned[ci] is not None:
+                    continue
+                matched.add(ti)
+                assigned[ci] = self.active[ti]
+
+        still_active = []
+        for ti, track in enumerate(self.active):
+            if ti not in matched:
+                track['missed'] += 1
+                if track['missed'] > self.max_missed:
+                    continue
+            still_active.append(track)
+        self.active = still_active
+
+        for ci, track in enumerate(assigned):
+            if track is None:
+                track = assigned[ci] = {'frames': 0}
+                self.active.append(track)
+            track['centroid'] = centroids[ci]
+            track['missed'] = 0
+            track['frames'] += 1
+            if track['frames'] == self.min_frames:
+                self.count += 1
+        return assigned